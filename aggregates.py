@@ -0,0 +1,377 @@
+import copy
+import numpy as np
+import pandas as pd
+from analysis import attempt_percentiles
+from profiling import cache_event, timed
+from progression import PROGRESSION_KEYS, progression_table, student_progression, subject_progression
+
+AGGREGATE_COLUMNS = ['Marks Sum', 'Count', 'Min Marks', 'Max Marks', 'Reattempts']
+
+# Thresholds on the average of each student's best attempt per subject, used by the
+# "Overall Subjects" categorisation
+PERFORMANCE_BINS = [0, 40, 70, 100]
+PERFORMANCE_LABELS = ["Weak", "Average", "Strong"]
+
+def _chunk_stats(chunk, key):
+    """Computes the additive per-key statistics of a single chunk."""
+    grouped = chunk.groupby(key, observed=True)
+    stats = grouped['Marks'].agg(['sum', 'count', 'min', 'max'])
+    stats['Reattempts'] = (chunk['Attempt'] > 1).groupby(chunk[key], observed=True).sum()
+    stats.columns = AGGREGATE_COLUMNS
+    return stats
+
+def _merge_stats(current, stats):
+    """Folds new per-key statistics into the running totals."""
+    if current is None:
+        return stats
+    combined = pd.concat([current, stats])
+    return combined.groupby(level=0).agg({
+        'Marks Sum': 'sum',
+        'Count': 'sum',
+        'Min Marks': 'min',
+        'Max Marks': 'max',
+        'Reattempts': 'sum'
+    })
+
+class PerformanceAggregates:
+    """Running per-student and per-subject mark statistics that can be built chunk by chunk."""
+
+    def __init__(self):
+        self.students = None
+        self.subjects = None
+        self.rows = 0
+
+    def update(self, chunk):
+        """Folds one chunk of rows into the aggregates."""
+        self.students = _merge_stats(self.students, _chunk_stats(chunk, 'Student Name'))
+        self.subjects = _merge_stats(self.subjects, _chunk_stats(chunk, 'Subject'))
+        self.rows += len(chunk)
+        return self
+
+    def _summary(self, stats, key):
+        """Turns running statistics into a frame with an `Average Marks` column."""
+        if stats is None:
+            return pd.DataFrame(columns=[key, 'Average Marks'] + AGGREGATE_COLUMNS[1:])
+        summary = stats.copy()
+        summary.insert(0, 'Average Marks', summary['Marks Sum'] / summary['Count'])
+        summary.index.name = key
+        return summary.drop(columns='Marks Sum').reset_index()
+
+    def student_summary(self):
+        """Returns per-student average, count, min/max marks and re-attempt count."""
+        return self._summary(self.students, 'Student Name')
+
+    def subject_summary(self):
+        """Returns per-subject average, count, min/max marks and re-attempt count."""
+        return self._summary(self.subjects, 'Subject')
+
+@timed()
+def build_aggregates(chunks):
+    """Consumes an iterable of DataFrame chunks and returns the folded aggregates."""
+    aggregates = PerformanceAggregates()
+    for chunk in chunks:
+        aggregates.update(chunk)
+    return aggregates
+
+def _student_stats(df, progression):
+    """Per-student summary of `df` with best/latest attempt averages and the overall Weak/Average/Strong category."""
+    students = PerformanceAggregates().update(df).student_summary()
+    students = students.merge(student_progression(progression), on='Student Name', how='left')
+    students['Performance Category'] = pd.cut(
+        students['Best Average Marks'],
+        bins=PERFORMANCE_BINS,
+        labels=PERFORMANCE_LABELS
+    )
+    return students
+
+def _replace_keys(summary, fresh, key, affected, dtype, order=None):
+    """Swaps the rows of `affected` keys in a summary frame for freshly computed ones, sorted by `order` (default `key`)."""
+    kept = summary[~summary[key].isin(affected)]
+    kept = kept.assign(**{key: kept[key].astype(dtype)})
+    fresh = fresh.assign(**{key: fresh[key].astype(dtype)})
+    return pd.concat([kept, fresh]).sort_values(order or key, kind='stable', ignore_index=True)
+
+def _move_rows(index, old_keys, new_keys, replaced, changed):
+    """Returns a copy of a key -> row positions index with replaced/appended rows filed under their new keys.
+
+    `old_keys` line up with `replaced` and `new_keys` with `changed` (the replaced rows,
+    then the appended ones). Rows whose key did not change are left where they are.
+    """
+    index = dict(index)
+    moved = {}
+    for i, row in enumerate(changed):
+        old_key = old_keys[i] if i < len(replaced) else None
+        if i < len(replaced) and old_key == new_keys[i]:
+            continue
+        if i < len(replaced) and old_key in index:
+            rows = index[old_key]
+            rows = np.delete(rows, np.searchsorted(rows, row))
+            if len(rows):
+                index[old_key] = rows
+            else:
+                del index[old_key]
+        moved.setdefault(new_keys[i], []).append(row)
+    for key, rows in moved.items():
+        current = index.get(key, np.array([], dtype=int))
+        rows = np.sort(rows)
+        index[key] = np.insert(current, np.searchsorted(current, rows), rows)
+    return index
+
+def _extreme_rows(marks, rows):
+    """Returns the rows holding the highest and lowest marks, skipping missing marks like idxmax/idxmin (None if all are missing)."""
+    present = rows[~np.isnan(marks[rows])]
+    if not len(present):
+        return None
+    return present[marks[present].argmax()], present[marks[present].argmin()]
+
+class AggregateStore:
+    """Statistics and row indexes for one loaded dataset, built once and shared by every page."""
+
+    @timed("aggregates.AggregateStore.build")
+    def __init__(self, df):
+        self.dataset_key = df.attrs.get("dataset_hash")
+        self.rows = len(df)
+
+        # Best/latest marks per (student, subject), shared by the pages and reports
+        self.progression = progression_table(df)
+        self._index_progression()
+        self.students = _student_stats(df, self.progression)
+        self.subjects = PerformanceAggregates().update(df).subject_summary()
+        self.grade_histogram = pd.crosstab(df['Subject'], df['Grade'])
+
+        # Row positions per key, so pages can slice with iloc instead of boolean masks
+        self.student_rows = df.groupby('Student Name', observed=True).indices
+        self.subject_rows = df.groupby('Subject', observed=True).indices
+        self._key_index = None
+
+        # Selectbox options in order of first appearance, as `unique()` would give them
+        self.student_options = list(df['Student Name'].unique())
+        self.subject_options = list(df['Subject'].unique())
+
+        marks = df['Marks'].to_numpy(dtype=float)
+        self.top_row, self.bottom_row = _extreme_rows(marks, np.arange(len(marks))) or (None, None)
+        self.subject_extremes = {}
+        for subject, rows in self.subject_rows.items():
+            extremes = _extreme_rows(marks, rows)
+            if extremes is not None:
+                self.subject_extremes[subject] = extremes
+
+        # Pairings are computed on demand and kept per subject/pairing function and options
+        self.subject_pairs = {}
+        self.overall_pairs = {}
+
+        # Overall trend bands and top/bottom students, computed on first use by the trend chart
+        self._attempt_bands = None
+        self._extreme_students = {}
+        # Subject summary of the Performance Analysis page, rolled up on first use
+        self._subject_summary = None
+
+    def key_index(self, df, keys):
+        """Returns a MultiIndex over the upsert key columns, built on first use."""
+        if self._key_index is None or list(self._key_index.names) != list(keys):
+            self._key_index = pd.MultiIndex.from_frame(df[list(keys)])
+        return self._key_index
+
+    def pairs_for_subject(self, df, subject, pair_fn, **options):
+        """Returns the cached pairing for one subject, computing it with `pair_fn(rows, **options)` on first use."""
+        key = (subject, tuple(sorted(options.items())))
+        cache_event("subject_pairs", key in self.subject_pairs)
+        if key not in self.subject_pairs:
+            self.subject_pairs[key] = pair_fn(self.select(df, subject=subject), **options)
+        return self.subject_pairs[key]
+
+    def pairs_overall(self, df, pair_fn, **options):
+        """Returns the cached cohort-wide pairing, computing it with `pair_fn(df, **options)` on first use."""
+        key = (pair_fn.__name__, tuple(sorted(options.items())))
+        cache_event("overall_pairs", key in self.overall_pairs)
+        if key not in self.overall_pairs:
+            self.overall_pairs[key] = pair_fn(df, **options)
+        return self.overall_pairs[key]
+
+    @timed()
+    def updated(self, old_df, df, replaced, appended):
+        """Returns a store for `df` after an upsert, recomputing only the affected students and subjects.
+
+        `replaced` are the row positions overwritten in place and `appended` the new rows
+        at the end of `df`. The original store is left untouched, since other sessions
+        may still be reading it.
+        """
+        store = copy.copy(self)
+        store.dataset_key = df.attrs.get("dataset_hash")
+        store.rows = len(df)
+        changed = np.concatenate([replaced, appended]).astype(int)
+
+        old_students = old_df['Student Name'].to_numpy()[replaced]
+        old_subjects = old_df['Subject'].to_numpy()[replaced]
+        new_students = df['Student Name'].to_numpy()[changed]
+        new_subjects = df['Subject'].to_numpy()[changed]
+        students = set(old_students) | set(new_students)
+        subjects = set(old_subjects) | set(new_subjects)
+
+        store.student_rows = _move_rows(self.student_rows, old_students, new_students, replaced, changed)
+        store.subject_rows = _move_rows(self.subject_rows, old_subjects, new_subjects, replaced, changed)
+        if self._key_index is not None:
+            store._key_index = self._key_index.append(pd.MultiIndex.from_frame(df.iloc[appended][list(self._key_index.names)]))
+
+        # Statistics and categories for the affected keys only
+        student_df = df.iloc[store.rows_for_students(list(students))]
+        subject_df = store.select(df, subject=list(subjects))
+        progression = progression_table(student_df)
+        store._update_progression(self, progression, students, df)
+        store.students = _replace_keys(self.students, _student_stats(student_df, progression), 'Student Name', students,
+                                       df['Student Name'].dtype)
+        store.subjects = _replace_keys(self.subjects, PerformanceAggregates().update(subject_df).subject_summary(),
+                                       'Subject', subjects, df['Subject'].dtype)
+        histogram = pd.crosstab(subject_df['Subject'], subject_df['Grade'])
+        histogram = pd.concat([
+            self.grade_histogram[~self.grade_histogram.index.isin(subjects)],
+            histogram
+        ]).fillna(0).astype(int)
+        # Concatenating drops the categorical labels; restore them so the layout matches a rebuild
+        histogram.index = pd.Index(histogram.index, dtype=df['Subject'].dtype, name='Subject')
+        histogram.columns = pd.Index(histogram.columns, dtype=df['Grade'].dtype, name='Grade')
+        store.grade_histogram = histogram.sort_index().sort_index(axis=1)
+
+        known_students, known_subjects = set(self.student_options), set(self.subject_options)
+        store.student_options = self.student_options + [s for s in pd.unique(new_students) if s not in known_students]
+        store.subject_options = self.subject_options + [s for s in pd.unique(new_subjects) if s not in known_subjects]
+
+        marks = df['Marks'].to_numpy(dtype=float)
+        store.subject_extremes = {k: v for k, v in self.subject_extremes.items() if k not in subjects}
+        for subject in subjects:
+            rows = store.subject_rows.get(subject)
+            extremes = _extreme_rows(marks, rows) if rows is not None else None
+            if extremes is not None:
+                store.subject_extremes[subject] = extremes
+        # The overall extremes are the best of the per-subject extremes; ties go to the earliest row
+        extremes = list(store.subject_extremes.values())
+        store.top_row = min((top for top, _ in extremes), key=lambda r: (-marks[r], r), default=None)
+        store.bottom_row = min((bottom for _, bottom in extremes), key=lambda r: (marks[r], r), default=None)
+
+        # Only the affected subjects need re-pairing; overall terciles depend on everyone
+        store.subject_pairs = {k: v for k, v in self.subject_pairs.items() if k[0] not in subjects}
+        store.overall_pairs = {}
+        store._attempt_bands = None
+        store._extreme_students = {}
+        store._subject_summary = None
+        return store
+
+    def attempt_bands(self, df):
+        """Returns the median/IQR marks per subject and attempt, computed once on first use."""
+        cache_event("attempt_bands", self._attempt_bands is not None)
+        if self._attempt_bands is None:
+            self._attempt_bands = attempt_percentiles(df)
+        return self._attempt_bands
+
+    def extreme_students(self, n=5):
+        """Returns the names of the `n` highest and `n` lowest students by average marks, from the student statistics."""
+        if n not in self._extreme_students:
+            averages = self.students.set_index('Student Name')['Average Marks']
+            self._extreme_students[n] = (list(averages.nlargest(n).index), list(averages.nsmallest(n).index))
+        return self._extreme_students[n]
+
+    def students_in_category(self, category):
+        """Returns the overall averages of students in a performance category."""
+        students = self.students[['Student Name', 'Average Marks', 'Best Average Marks', 'Latest Average Marks',
+                                  'Performance Category']]
+        return students[students['Performance Category'] == category]
+
+    def performance_summaries(self, students):
+        """Returns the Performance Analysis summaries from the stored statistics, as `analysis.performance_summaries` would.
+
+        The student summary is limited to `students`; the subject summary covers every
+        student and is rolled up once on first use.
+        """
+        student_performance = self.students.loc[
+            self.students['Student Name'].isin(students),
+            ['Student Name', 'Average Marks', 'Best Average Marks', 'Latest Average Marks']
+        ].reset_index(drop=True)
+        if self._subject_summary is None:
+            self._subject_summary = self.subjects[['Subject', 'Average Marks']].merge(
+                subject_progression(self.progression), on='Subject', how='left')
+        return student_performance, self._subject_summary
+
+    def _index_progression(self):
+        """Indexes the progression table's row positions per student and per subject."""
+        self.progression_student_rows = self.progression.groupby('Student Name', observed=True).indices
+        self.progression_subject_rows = self.progression.groupby('Subject', observed=True).indices
+
+    def _update_progression(self, old, fresh, students, df):
+        """Swaps `students`' rows of `old`'s progression table for `fresh` ones and updates the indexes to match.
+
+        Existing (student, subject) rows are overwritten in place and new pairs appended,
+        so the indexes only gain rows; the table is regrouped only if a student lost a pair.
+        """
+        dtypes = {'Student Name': df['Student Name'].dtype, 'Subject': df['Subject'].dtype,
+                  'Latest Grade': df['Grade'].dtype}
+        table, fresh = old.progression.astype(dtypes), fresh.astype(dtypes)
+        common = pd.concat([table.iloc[:0], fresh.iloc[:0]]).dtypes.to_dict()
+        table, fresh = table.astype(common), fresh.astype(common)
+
+        positions = [old.progression_student_rows[s] for s in students if s in old.progression_student_rows]
+        positions = np.concatenate(positions) if positions else np.array([], dtype=int)
+        old_keys = pd.MultiIndex.from_frame(table.iloc[positions][PROGRESSION_KEYS])
+        fresh_keys = pd.MultiIndex.from_frame(fresh[PROGRESSION_KEYS])
+        if not old_keys.isin(fresh_keys).all():
+            self.progression = _replace_keys(table, fresh, 'Student Name', students, df['Student Name'].dtype,
+                                             PROGRESSION_KEYS)
+            self._index_progression()
+            return
+
+        targets = old_keys.get_indexer(fresh_keys)
+        existing = targets >= 0
+        for column in table.columns:
+            table.iloc[positions[targets[existing]], table.columns.get_loc(column)] = fresh[column].array[existing]
+
+        added = fresh[~existing]
+        appended = np.arange(len(table), len(table) + len(added))
+        self.progression = pd.concat([table, added], ignore_index=True)
+        none = np.array([], dtype=int)
+        self.progression_student_rows = _move_rows(old.progression_student_rows, [], added['Student Name'].to_numpy(),
+                                                   none, appended)
+        self.progression_subject_rows = _move_rows(old.progression_subject_rows, [], added['Subject'].to_numpy(),
+                                                   none, appended)
+
+    def progression_for(self, students=None, subject=None):
+        """Returns the progression rows of a student (or list of students) and/or a subject without a full scan."""
+        if students is None:
+            if subject is None:
+                return self.progression
+            return self.progression.iloc[self.progression_subject_rows.get(subject, [])]
+        if isinstance(students, str):
+            students = [students]
+        positions = [self.progression_student_rows[s] for s in students if s in self.progression_student_rows]
+        if not positions:
+            return self.progression.iloc[[]]
+        positions = np.sort(np.concatenate(positions))
+        if subject is not None:
+            # Only the selected students' few rows are checked for the subject
+            positions = positions[self.progression['Subject'].iloc[positions].to_numpy() == subject]
+        return self.progression.iloc[positions]
+
+    def rows_for_students(self, students):
+        """Returns the sorted row positions of the given students."""
+        positions = [self.student_rows[s] for s in students if s in self.student_rows]
+        if not positions:
+            return np.array([], dtype=int)
+        return np.sort(np.concatenate(positions))
+
+    def select(self, df, students=None, subject=None):
+        """Returns the rows of `df` for a student (or list of students) and/or a subject without a full scan.
+
+        Without students, `subject` may also be a list of subjects.
+        """
+        if students is None:
+            if subject is None:
+                return df
+            if isinstance(subject, (list, set)):
+                positions = [self.subject_rows[s] for s in subject if s in self.subject_rows]
+                return df.iloc[np.sort(np.concatenate(positions)) if positions else []]
+            return df.iloc[self.subject_rows.get(subject, [])]
+        if isinstance(students, str):
+            students = [students]
+        positions = self.rows_for_students(students)
+        if subject is not None:
+            # Only the selected students' rows are checked for the subject
+            positions = positions[df['Subject'].iloc[positions].to_numpy() == subject]
+        return df.iloc[positions]
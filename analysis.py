@@ -1,14 +1,51 @@
-import streamlit as st
 import pandas as pd
-import plotly.express as px
+from profiling import timed
+from progression import student_progression, subject_progression
 
-def analyze_performance(df):
-    """Displays student-wise performance analysis without showing missing values."""
+# Streamlit and Plotly are imported inside the rendering functions, so the
+# computations here can be used headless without paying for those imports.
+
+REQUIRED_COLUMNS = {'Student Name', 'Subject', 'Marks', 'Grade'}
+
+@timed()
+def performance_summaries(df, progression=None):
+    """Computes the student-wise and subject-wise average marks.
+
+    With a progression table the averages of each student's best and latest attempts
+    are added alongside the all-attempt average.
+    """
+    student_performance = df.groupby('Student Name', observed=True)[['Marks']].mean().reset_index()
+    student_performance.columns = ['Student Name', 'Average Marks']
+
+    subject_performance = df.groupby('Subject', observed=True)[['Marks']].mean().reset_index()
+    subject_performance.columns = ['Subject', 'Average Marks']
+
+    if progression is not None:
+        attempts = student_progression(progression)[['Student Name', 'Best Average Marks', 'Latest Average Marks']]
+        student_performance = student_performance.merge(attempts, on='Student Name', how='left')
+        subject_performance = subject_performance.merge(subject_progression(progression), on='Subject', how='left')
+    return student_performance, subject_performance
+
+def analyze_performance(df, aggregates=None, progression=None, summaries=None):
+    """Displays student-wise performance analysis without showing missing values.
+
+    When streamed `aggregates` are given the summaries are served from them and
+    `df` may be None. A `progression` table adds best/latest-attempt views, and
+    precomputed (student, subject) `summaries` are shown instead of recomputed from `df`.
+    """
+    import streamlit as st
     st.subheader("Performance Analysis")
-    
+
+    if aggregates is not None:
+        st.write(f"📋 **Rows Processed:** {aggregates.rows}")
+        st.write("📊 **Student Performance Summary:**")
+        st.write(aggregates.student_summary())
+        st.write("📖 **Subject Performance Summary:**")
+        st.write(aggregates.subject_summary())
+        return
+
     # Check if required columns exist
-    required_columns = {'Student Name', 'Subject', 'Marks', 'Grade'}
-    if not required_columns.issubset(df.columns):
+    if not REQUIRED_COLUMNS.issubset(df.columns):
         st.error("⚠️ Missing required columns in dataset!")
         return
     
@@ -16,25 +53,35 @@ def analyze_performance(df):
     st.write("📋 **Data Preview:**")
     st.write(df.head())
     
-    # Student-wise performance summary
-    student_performance = df.groupby('Student Name')[['Marks']].mean().reset_index()
-    student_performance.columns = ['Student Name', 'Average Marks']
+    if summaries is None:
+        summaries = performance_summaries(df, progression)
+    student_performance, subject_performance = summaries
     st.write("📊 **Student Performance Summary:**")
     st.write(student_performance)
     
     # Display subject-wise performance
-    subject_performance = df.groupby('Subject')[['Marks']].mean().reset_index()
-    subject_performance.columns = ['Subject', 'Average Marks']
     st.write("📖 **Subject Performance Summary:**")
     st.write(subject_performance)
 
-def analyze_individual_performance(df):
-    """Analyze performance of an individual student in a specific subject over multiple attempts."""
+    if progression is not None:
+        st.write("🔁 **Attempt Progression (best, latest and improvement per subject):**")
+        st.write(progression)
+
+def analyze_individual_performance(df, store=None):
+    """Analyze performance of an individual student in a specific subject over multiple attempts.
+
+    With an `AggregateStore` the options and rows come from its indexes instead of scanning `df`.
+    """
+    import streamlit as st
+    import plotly.express as px
     st.subheader("🎓 Individual Student Performance")
-    student = st.selectbox("📌 Select a Student", df['Student Name'].unique())
-    subject = st.selectbox("📖 Select a Subject", df['Subject'].unique())
+    student = st.selectbox("📌 Select a Student", store.student_options if store else df['Student Name'].unique())
+    subject = st.selectbox("📖 Select a Subject", store.subject_options if store else df['Subject'].unique())
     
-    student_data = df[(df['Student Name'] == student) & (df['Subject'] == subject)]
+    if store is not None:
+        student_data = store.select(df, student, subject)
+    else:
+        student_data = df[(df['Student Name'] == student) & (df['Subject'] == subject)]
     
     if student_data.empty:
         st.warning("⚠️ No data available for this student in the selected subject.")
@@ -46,14 +93,22 @@ def analyze_individual_performance(df):
                   title=f"📈 Performance of {student} in {subject}")
     st.plotly_chart(fig)
 
-def analyze_multiple_students(df):
-    """Compare performance of multiple students in a specific subject over multiple attempts."""
+def analyze_multiple_students(df, store=None):
+    """Compare performance of multiple students in a specific subject over multiple attempts.
+
+    With an `AggregateStore` the options and rows come from its indexes instead of scanning `df`.
+    """
+    import streamlit as st
+    import plotly.express as px
     st.subheader("👥 Compare Multiple Students in a Subject")
-    students = st.multiselect("📌 Select Students", df['Student Name'].unique())
-    subject = st.selectbox("📖 Select a Subject", df['Subject'].unique())
+    students = st.multiselect("📌 Select Students", store.student_options if store else df['Student Name'].unique())
+    subject = st.selectbox("📖 Select a Subject", store.subject_options if store else df['Subject'].unique())
     
     if students:
-        student_data = df[(df['Student Name'].isin(students)) & (df['Subject'] == subject)]
+        if store is not None:
+            student_data = store.select(df, students, subject)
+        else:
+            student_data = df[(df['Student Name'].isin(students)) & (df['Subject'] == subject)]
         
         if student_data.empty:
             st.warning("⚠️ No data available for selected students in this subject.")
@@ -65,8 +120,76 @@ def analyze_multiple_students(df):
                       title=f"📊 Comparison of Student Performance in {subject}")
         st.plotly_chart(fig)
 
-def plot_performance_graph(df):
-    """Plots a performance trend graph for all students."""
+# Above this many rows the overall trend is drawn as percentile bands instead of one trace per student
+RAW_ROW_BUDGET = 5_000
+
+@timed()
+def attempt_percentiles(df):
+    """Computes the median and inter-quartile range of marks for every subject and attempt."""
+    keys = ['Subject', 'Attempt'] if 'Subject' in df.columns else ['Attempt']
+    grouped = df.groupby(keys, observed=True)['Marks']
+    bands = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    bands.columns = ['Q1', 'Median', 'Q3']
+    bands['Students'] = grouped.size()
+    return bands.reset_index()
+
+def extreme_students(df, n=5):
+    """Returns the names of the `n` highest and `n` lowest students by average marks."""
+    averages = df.groupby('Student Name', observed=True)['Marks'].mean()
+    return list(averages.nlargest(n).index), list(averages.nsmallest(n).index)
+
+@timed()
+def aggregated_trend_figure(df, top_n=5, store=None):
+    """Builds the overall trend as per-subject median/IQR bands with top/bottom student overlays.
+
+    With an `AggregateStore` the bands and extreme students are computed once per dataset
+    and the overlay rows come from its indexes, so reruns do not scan `df`.
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+    bands = store.attempt_bands(df) if store is not None else attempt_percentiles(df)
+    fig = go.Figure()
+
+    subjects = bands.groupby('Subject', observed=True) if 'Subject' in bands.columns else [("All Subjects", bands)]
+    for i, (subject, band) in enumerate(subjects):
+        color = px.colors.qualitative.Plotly[i % len(px.colors.qualitative.Plotly)]
+        fig.add_trace(go.Scattergl(x=band['Attempt'], y=band['Q3'], mode='lines', line=dict(width=0),
+                                   legendgroup=str(subject), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scattergl(x=band['Attempt'], y=band['Q1'], mode='lines', line=dict(width=0),
+                                   fill='tonexty', fillcolor=color, opacity=0.2, legendgroup=str(subject),
+                                   name=f"{subject} IQR", hoverinfo='skip'))
+        fig.add_trace(go.Scattergl(x=band['Attempt'], y=band['Median'], mode='lines+markers',
+                                   line=dict(color=color), legendgroup=str(subject), name=f"{subject} median",
+                                   customdata=band['Students'],
+                                   hovertemplate="Attempt %{x}<br>Median %{y}<br>%{customdata} rows"))
+
+    if top_n:
+        if store is not None:
+            top, bottom = store.extreme_students(top_n)
+            overlay = df.iloc[store.rows_for_students(top + bottom)]
+        else:
+            top, bottom = extreme_students(df, top_n)
+            overlay = df[df['Student Name'].isin(top + bottom)]
+        trend = overlay.groupby(['Student Name', 'Attempt'], observed=True)['Marks'].mean().reset_index()
+        for student, rows in trend.groupby('Student Name', observed=True):
+            fig.add_trace(go.Scattergl(x=rows['Attempt'], y=rows['Marks'], mode='lines+markers',
+                                       line=dict(dash='dot' if student in bottom else 'dash'),
+                                       name=f"{'Top' if student in top else 'Bottom'}: {student}"))
+
+    fig.update_layout(title="📊 Overall Student Performance Trend (median and IQR per attempt)",
+                      xaxis_title="Attempt", yaxis_title="Marks")
+    return fig
+
+@timed()
+def plot_performance_graph(df, mode="auto", top_n=5, row_budget=RAW_ROW_BUDGET, store=None):
+    """Plots a performance trend graph for all students.
+
+    `mode` is "raw" (one WebGL trace per student), "aggregated" (percentile bands plus
+    top/bottom `top_n` students) or "auto", which picks raw only within `row_budget` rows.
+    An `AggregateStore` serves the aggregated view's statistics (see `aggregated_trend_figure`).
+    """
+    import streamlit as st
+    import plotly.express as px
     st.subheader("📈 Overall Performance Trend")
 
     # Ensure required columns exist
@@ -75,6 +198,12 @@ def plot_performance_graph(df):
         st.error(f"⚠️ Missing required columns: {required_columns - set(df.columns)}")
         return
 
-    fig = px.line(df, x='Attempt', y='Marks', color='Student Name', markers=True, 
-                  title="📊 Overall Student Performance Trend")
+    if mode == "auto":
+        mode = "raw" if len(df) <= row_budget else "aggregated"
+
+    if mode == "raw":
+        fig = px.line(df, x='Attempt', y='Marks', color='Student Name', markers=True, render_mode='webgl',
+                      title="📊 Overall Student Performance Trend")
+    else:
+        fig = aggregated_trend_figure(df, top_n, store)
     st.plotly_chart(fig)
@@ -0,0 +1,164 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from datagenerate import SUBJECTS, generate_attempts, synthetic_names
+from data_preprocessing import load_data
+from pair import pair_students_by_subject, pair_students_multi_subject, pair_students_overall
+from recommend import apply_recommendations
+from generate import generate_report
+from profiling import peak_rss_mb
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+STAGES = ["load_data", "pair_by_subject", "pair_overall", "pair_multi_subject", "recommendations", "report"]
+
+# Pairing switches to the greedy matcher for large cohorts, so nothing is skipped by default;
+# set a row limit to leave pairing out of very large runs
+PAIR_MAX_ROWS = None
+
+def make_dataset(rows, seed=0):
+    """Synthesises roughly `rows` attempt rows with the datagenerate logic."""
+    rows_per_student = len(SUBJECTS) * 1.07  # ~7% of subjects need a second attempt
+    ids, names = synthetic_names(max(1, int(rows / rows_per_student)))
+    return generate_attempts(ids, names, rng=seed)
+
+class _Upload(io.BytesIO):
+    """In-memory stand-in for a Streamlit upload."""
+    name = "benchmark.csv"
+
+def _stage_runners(df, csv_bytes):
+    """Returns the callables timed for each stage."""
+    student = df["Student Name"].iloc[0]
+    return {
+        "load_data": lambda: load_data(_Upload(csv_bytes), use_cache=False),
+        "pair_by_subject": lambda: pair_students_by_subject(df),
+        "pair_overall": lambda: pair_students_overall(df),
+        "pair_multi_subject": lambda: pair_students_multi_subject(df),
+        "recommendations": lambda: apply_recommendations(df),
+        "report": lambda: generate_report(student, df)
+    }
+
+def measure(fn, repeat=1, trace_allocations=True):
+    """Times `fn` (best of `repeat`) and records memory and, optionally, peak traced allocations.
+
+    `process_peak_rss_mb` is the process's high-water mark so far, so it only grows
+    across stages; `rss_growth_mb` is how far this stage raised it. Both are None
+    where the platform does not report RSS.
+    """
+    rss_before = peak_rss_mb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    rss_after = peak_rss_mb()
+    result = {
+        "seconds": min(timings),
+        "process_peak_rss_mb": rss_after,
+        "rss_growth_mb": None if rss_after is None else round(rss_after - rss_before, 1)
+    }
+    if trace_allocations:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_alloc_mb"] = round(peak / (1024 * 1024), 1)
+    return result
+
+def _run_sizes(sizes, stages, repeat, trace_allocations, seed, pair_max_rows):
+    """Generates each dataset size and returns one result per stage."""
+    results = []
+    for label in sizes:
+        df = make_dataset(SIZES[label], seed)
+        csv_bytes = df.to_csv(index=False).encode()
+        runners = _stage_runners(df, csv_bytes)
+        for stage in stages:
+            if stage.startswith("pair") and pair_max_rows is not None and len(df) > pair_max_rows:
+                print(f"{label:>5} {stage:<18} skipped (more than {pair_max_rows} rows)")
+                continue
+            result = measure(runners[stage], repeat, trace_allocations)
+            result.update({"stage": stage, "size": label, "rows": len(df)})
+            results.append(result)
+            rss = (f"  rss +{result['rss_growth_mb']:7.1f} MB (process peak {result['process_peak_rss_mb']:8.1f} MB)"
+                   if result["process_peak_rss_mb"] is not None else "")
+            print(f"{label:>5} {stage:<18} {result['seconds']:9.3f}s{rss}"
+                  + (f"  alloc {result['peak_alloc_mb']:8.1f} MB" if trace_allocations else ""))
+    return results
+
+def run(sizes, stages=STAGES, repeat=1, trace_allocations=True, seed=0, pair_max_rows=PAIR_MAX_ROWS):
+    """Runs every stage at every dataset size and returns the results document."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir:
+        os.chdir(workdir)  # generate_report writes its PDF to the working directory
+        try:
+            results = _run_sizes(sizes, stages, repeat, trace_allocations, seed, pair_max_rows)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": repeat
+        },
+        "results": results
+    }
+
+def compare(current, baseline, threshold):
+    """Returns the (stage, size, baseline s, current s) entries that slowed down by more than `threshold`."""
+    previous = {(r["stage"], r["size"]): r["seconds"] for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        before = previous.get((r["stage"], r["size"]))
+        if before is not None and r["seconds"] > before * (1 + threshold):
+            regressions.append((r["stage"], r["size"], before, r["seconds"]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmarks for ingest, pairing, recommendations and reports.")
+    parser.add_argument("--sizes", default="1k,100k", help=f"comma-separated sizes from {', '.join(SIZES)}")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc allocation run")
+    parser.add_argument("--pair-max-rows", type=int, default=PAIR_MAX_ROWS, help="skip pairing above this many rows")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",")]
+    stages = [s.strip() for s in args.stages.split(",")]
+    unknown = [s for s in sizes if s not in SIZES] + [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown sizes/stages: {unknown}")
+
+    current = run(sizes, stages, args.repeat, not args.no_alloc, pair_max_rows=args.pair_max_rows)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(current, json.load(file), args.threshold)
+        for stage, size, before, after in regressions:
+            print(f"REGRESSION {size} {stage}: {before:.3f}s -> {after:.3f}s")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
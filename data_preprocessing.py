@@ -1,13 +1,47 @@
-def load_data(file):
-    import pandas as pd
-    if file.name.endswith('.csv'):
-        df = pd.read_csv(file)
-    elif file.name.endswith('.xlsx'):
-        df = pd.read_excel(file, engine='openpyxl')
-    else:
-        return None
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from profiling import timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; fall back to plain pandas parsing
+    pa = feather = None
+
+CACHE_DIR = ".cache"
+
+REQUIRED_COLUMNS = {"Student Name", "Subject", "Marks", "Attempt"}
+
+# A result row is identified by these columns when new attempt results are merged in
+UPSERT_KEYS = ["Student ID", "Subject Code", "Attempt"]
+
+# Column dtypes applied after the column names are standardized
+SCHEMA = {
+    "Student Name": "category",
+    "Subject": "category",
+    "Subject Code": "category",
+    "Grade": "category",
+    "Marks": "int16",
+    "Attempt": "int8"
+}
+
+# Part of every Feather cache name; bump it whenever SCHEMA or apply_schema change
+# so frames cached under the old rules are rebuilt instead of served
+SCHEMA_VERSION = 2
+
+def file_digest(file):
+    """Returns a sha256 hash of the uploaded file's content."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(1 << 20), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
 
-    # Standardize column names
+def standardize_columns(df):
+    """Strips column names and maps the known upload headers onto the dashboard's names."""
     df.columns = df.columns.str.strip()  # Remove extra spaces
     column_mapping = {
         "S.NO": "Student ID",
@@ -18,3 +52,176 @@ def load_data(file):
 
     df.rename(columns=column_mapping, inplace=True)
     return df
+
+def dataset_hash(df):
+    """Returns the content hash of a loaded dataset, computing one if it was not loaded from a file."""
+    if "dataset_hash" not in df.attrs:
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        df.attrs["dataset_hash"] = hashlib.sha256(row_hashes.tobytes()).hexdigest()
+    return df.attrs["dataset_hash"]
+
+def _fits_integer(values, dtype):
+    """Checks that numeric `values` are all present, whole and within the range of integer `dtype`."""
+    info = np.iinfo(dtype)
+    return bool(values.notna().all() and (values.between(info.min, info.max) & (values % 1 == 0)).all())
+
+def apply_schema(df, categorical=True):
+    """Casts known columns to compact dtypes.
+
+    Numeric columns are parsed leniently, so entries such as "AB" become missing, and
+    are only narrowed to their integer dtype when every value is a whole number in
+    range; decimals, gaps and out-of-range values keep the column as floats.
+    """
+    for column, dtype in SCHEMA.items():
+        if column not in df.columns:
+            continue
+        if dtype == "category":
+            if categorical:
+                df[column] = df[column].astype(dtype)
+            continue
+        values = pd.to_numeric(df[column], errors="coerce")
+        df[column] = values.astype(dtype) if _fits_integer(values, dtype) else values.astype(float)
+    return df
+
+def _read_file(file):
+    """Parses a CSV or Excel upload into a DataFrame, or None for other file types."""
+    if file.name.endswith('.csv'):
+        return pd.read_csv(file, engine="pyarrow" if feather else "c")
+    elif file.name.endswith('.xlsx'):
+        return pd.read_excel(file, engine='openpyxl')
+    return None
+
+def _read_cache(cache_path, digest):
+    """Reads a Feather cache memory-mapped; numeric columns stay backed by the mapped file instead of copied."""
+    df = feather.read_table(cache_path, memory_map=True).to_pandas(split_blocks=True)
+    df.attrs["dataset_hash"] = digest
+    return df
+
+@timed()
+def load_data(file, use_cache=True):
+    """Loads an uploaded CSV/Excel file with typed columns, reusing a cached Feather copy if present."""
+    if not file.name.endswith(('.csv', '.xlsx')):
+        return None
+
+    digest = file_digest(file)
+    cache_path = os.path.join(CACHE_DIR, f"{digest}.v{SCHEMA_VERSION}.feather")
+    if use_cache and feather and os.path.exists(cache_path):
+        return _read_cache(cache_path, digest)
+
+    df = standardize_columns(_read_file(file))
+    df = apply_schema(df)
+
+    if use_cache and feather:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Uncompressed so later loads can be memory-mapped; written aside and
+        # renamed so concurrent sessions never read a half-written file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            feather.write_feather(df, tmp_path, compression="uncompressed")
+        except pa.ArrowException:
+            # Columns Arrow cannot type (e.g. ENROLL NO mixing "E12" and 1001) are
+            # served uncached rather than failing the upload
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, cache_path)
+            return _read_cache(cache_path, digest)
+
+    df.attrs["dataset_hash"] = digest
+    return df
+
+def write_chunks(chunks, output_file):
+    """Streams DataFrame chunks into `output_file`, as Parquet if it ends in `.parquet` and as CSV otherwise."""
+    parquet = output_file.endswith('.parquet')
+    if parquet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    writer = None
+
+    try:
+        for i, chunk in enumerate(chunks):
+            if parquet:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_file, table.schema)
+                # A later chunk may widen a column (e.g. a gap turns int64 marks into
+                # doubles); cast it back to the file's schema, which the first chunk fixed
+                writer.write_table(table.cast(writer.schema))
+            else:
+                chunk.to_csv(output_file, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+    return output_file
+
+def load_data_chunks(file, chunksize=100_000, required_columns=REQUIRED_COLUMNS):
+    """Yields the upload as standardized chunks of at most `chunksize` rows without loading it whole.
+
+    Every chunk is checked for `required_columns`. Names are kept as plain strings
+    because per-chunk categories would not line up across chunks.
+    """
+    if file.name.endswith('.csv'):
+        file.seek(0)
+        chunks = pd.read_csv(file, chunksize=chunksize)
+    elif file.name.endswith('.xlsx'):
+        # Excel workbooks cannot be parsed incrementally, so slice the sheet instead
+        sheet = pd.read_excel(file, engine='openpyxl')
+        chunks = (sheet.iloc[start:start + chunksize] for start in range(0, len(sheet), chunksize))
+    else:
+        return
+
+    for chunk in chunks:
+        chunk = standardize_columns(chunk)
+        missing = set(required_columns) - set(chunk.columns)
+        if missing:
+            raise ValueError(f"Uploaded file is missing required columns: {sorted(missing)}")
+        yield apply_schema(chunk, categorical=False)
+
+@timed()
+def upsert_results(df, batch, keys=UPSERT_KEYS, key_index=None):
+    """Merges a batch of attempt results into `df`, replacing rows with matching keys and appending the rest.
+
+    `key_index` is an optional prebuilt MultiIndex over `keys` for `df` (see
+    `AggregateStore.key_index`). Returns the updated frame plus the row positions
+    that were replaced and appended; `df` itself is not modified.
+    """
+    batch = apply_schema(standardize_columns(batch.copy()), categorical=False)
+    missing = set(keys) - set(batch.columns)
+    if missing:
+        raise ValueError(f"Result batch is missing key columns: {sorted(missing)}")
+    batch = batch.drop_duplicates(keys, keep="last").reset_index(drop=True)
+
+    if key_index is None:
+        key_index = pd.MultiIndex.from_frame(df[keys])
+    positions = key_index.get_indexer(pd.MultiIndex.from_frame(batch[keys]))
+    is_new = positions < 0
+
+    # New names or subjects become new categories rather than turning the columns into objects
+    categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype) and c in batch.columns]
+    extended = {}
+    for column in categorical:
+        new_values = pd.Index(batch[column].dropna().unique()).difference(df[column].cat.categories)
+        extended[column] = df[column].cat.add_categories(new_values) if len(new_values) else df[column]
+    # Decimal marks in the batch widen an integer column instead of being truncated to it
+    for column in batch.columns.intersection(df.columns):
+        if pd.api.types.is_numeric_dtype(df[column]) and pd.api.types.is_numeric_dtype(batch[column]):
+            wider = np.result_type(df[column].dtype, batch[column].dtype)
+            if wider != df[column].dtype:
+                extended[column] = df[column].astype(wider)
+    base = df.assign(**extended) if extended else df
+    dtypes = {c: base[c].dtype for c in batch.columns if c in base.columns}
+
+    appended = batch.loc[is_new].reindex(columns=base.columns)
+    appended = appended.astype({c: t for c, t in dtypes.items() if not appended[c].isna().any()})
+    merged = pd.concat([base, appended], ignore_index=True)
+
+    replaced = positions[~is_new]
+    for column in batch.columns:
+        if column in merged.columns and len(replaced):
+            values = batch.loc[~is_new, column].astype(dtypes[column]).to_numpy()
+            merged.iloc[replaced, merged.columns.get_loc(column)] = values
+
+    digest = hashlib.sha256(dataset_hash(df).encode())
+    digest.update(pd.util.hash_pandas_object(batch, index=False).to_numpy().tobytes())
+    merged.attrs["dataset_hash"] = digest.hexdigest()
+    return merged, replaced, np.arange(len(df), len(merged))
@@ -1,66 +1,113 @@
+import argparse
+import numpy as np
 import pandas as pd
-import random
+from data_preprocessing import write_chunks
+from progression import PASS_MARK
 
-def generate_synthetic_dataset(input_file, output_file):
-    """Generates a synthetic dataset based on an uploaded student name list and saves it to a new file."""
-    df = pd.read_csv("E:/namelist.csv")  # Load uploaded file
+SUBJECTS = {
+    'Mathematics': 'MATH101',
+    'Python': 'PY102',
+    'Machine Learning': 'ML103',
+    'English': 'GP104',
+    'Database': 'CS105'
+}
+
+MAX_ATTEMPTS = 3
+
+# Lower bounds of each grade band, in the order np.digitize expects
+GRADE_BINS = [35, 45, 55, 65, 75, 85]
+GRADE_LABELS = ['F', 'E', 'D', 'C', 'B', 'A', 'S']
+
+def load_name_list(input_file):
+    """Reads a student name list and returns (student IDs, names)."""
+    df = pd.read_csv(input_file)  # Load uploaded file
     df.columns = df.columns.str.strip()  # Remove extra spaces from column names
-    
+
     print("Columns in Uploaded File:", df.columns.tolist())  # Debugging step
-    
+
     column_mapping = {
-    "NAME": "Name",
-    "STUDENT ID": "Student ID",
-    "ID": "Student ID",
-    "FULL NAME": "Name",
-    "Sl. No.": "Student ID",  # Fix here
-    "MAIL": "Email"
-}
+        "NAME": "Name",
+        "STUDENT ID": "Student ID",
+        "ID": "Student ID",
+        "FULL NAME": "Name",
+        "Sl. No.": "Student ID",  # Fix here
+        "MAIL": "Email"
+    }
     df.rename(columns=column_mapping, inplace=True)
 
-    
     if "Name" not in df.columns or "Student ID" not in df.columns:
         raise ValueError("Uploaded file must contain 'Name' and 'Student ID' columns.")
-    
-    subjects = {
-        'Mathematics': 'MATH101',
-        'Python': 'PY102',
-        'Machine Learning': 'ML103',
-        'English': 'GP104',
-        'Database': 'CS105'
-    }
-    
-    synthetic_data = []
-    
-    for _, row in df.iterrows():
-        student_name = row['Name']
-        student_id = row['Student ID']
-        for subject, subject_code in subjects.items():
-            attempt = 1
-            marks = random.randint(30, 100)  # Ensure marks are between 30 and 100
-            
-            while attempt <= 3:
-                grade = assign_grade(marks)
-                synthetic_data.append({
-                    'Student ID': student_id,
-                    'Student Name': student_name,
-                    'Subject': subject,
-                    'Subject Code': subject_code,
-                    'Attempt': attempt,
-                    'Marks': marks,
-                    'Grade': grade
-                })
-                
-                if marks >= 35:
-                    break  # No need for further attempts
-                
-                # Increase marks slightly for re-attempts (max 100)
-                marks = min(100, marks + random.randint(5, 15))
-                attempt += 1
-    
-    synthetic_df = pd.DataFrame(synthetic_data)
-    synthetic_df.to_csv(output_file, index=False)
+
+    return df["Student ID"].to_numpy(), df["Name"].to_numpy()
+
+def synthetic_names(n_students, start=0):
+    """Generates placeholder student IDs and names when no name list is given."""
+    ids = np.arange(start + 1, start + n_students + 1)
+    names = np.char.add("STUDENT ", ids.astype(str))
+    return ids, names
+
+def assign_grades(marks):
+    """Assigns grades to an array of marks in one pass."""
+    codes = np.digitize(marks, GRADE_BINS)
+    return pd.Categorical.from_codes(codes, categories=GRADE_LABELS)
+
+def generate_attempts(student_ids, student_names, subjects=SUBJECTS, rng=None):
+    """Builds the attempt rows for the given students as a DataFrame.
+
+    Every student takes every subject with marks between 30 and 100 and re-attempts
+    (gaining 5-15 marks, capped at 100) while below the pass mark, up to MAX_ATTEMPTS.
+    """
+    rng = np.random.default_rng(rng)
+    n_students, n_subjects = len(student_ids), len(subjects)
+    n = n_students * n_subjects
+
+    # Marks for every possible attempt, then how many attempts each pair actually needed
+    marks = np.empty((n, MAX_ATTEMPTS), dtype=np.int16)
+    marks[:, 0] = rng.integers(30, 101, n)
+    for attempt in range(1, MAX_ATTEMPTS):
+        marks[:, attempt] = np.minimum(100, marks[:, attempt - 1] + rng.integers(5, 16, n))
+    # Marks never drop between attempts, so failures form a prefix and the attempt
+    # count is one more than the failures before the final allowed attempt
+    attempts = 1 + (marks[:, :-1] < PASS_MARK).sum(axis=1)
+
+    # Expand each (student, subject) pair into one row per attempt
+    pair = np.repeat(np.arange(n), attempts)
+    attempt_no = np.arange(len(pair)) - np.repeat(np.cumsum(attempts) - attempts, attempts)
+    row_marks = marks[pair, attempt_no]
+    student = pair // n_subjects
+    subject = pair % n_subjects
+
+    return pd.DataFrame({
+        'Student ID': np.asarray(student_ids)[student],
+        'Student Name': np.asarray(student_names)[student],
+        'Subject': pd.Categorical.from_codes(subject, categories=list(subjects)),
+        'Subject Code': pd.Categorical.from_codes(subject, categories=list(subjects.values())),
+        'Attempt': (attempt_no + 1).astype(np.int8),
+        'Marks': row_marks,
+        'Grade': assign_grades(row_marks)
+    })
+
+def generate_synthetic_dataset(input_file=None, output_file="synthetic_dataset.csv", n_students=1000,
+                               subjects=SUBJECTS, seed=None, chunk_size=100_000):
+    """Generates a synthetic dataset from a student name list (or synthetic names) and saves it.
+
+    Students are processed `chunk_size` at a time and appended to `output_file`, which is
+    written as Parquet if it ends in `.parquet` and as CSV otherwise.
+    """
+    if input_file is not None:
+        student_ids, student_names = load_name_list(input_file)
+    else:
+        student_ids, student_names = synthetic_names(n_students)
+
+    rng = np.random.default_rng(seed)
+    chunks = (
+        generate_attempts(student_ids[start:start + chunk_size], student_names[start:start + chunk_size], subjects, rng)
+        for start in range(0, max(len(student_ids), 1), chunk_size)
+    )
+    write_chunks(chunks, output_file)
+
     print(f"Synthetic dataset saved to {output_file}")
+    return output_file
 
 def assign_grade(marks):
     """Assigns a grade based on marks."""
@@ -80,6 +127,11 @@ def assign_grade(marks):
         return 'F'
 
 if __name__ == "__main__":
-    input_file = "students.csv"  # Replace with your actual file name
-    output_file = "synthetic_dataset.csv"
-    generate_synthetic_dataset(input_file, output_file)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate a synthetic student performance dataset.")
+    parser.add_argument("--input", help="CSV name list with Name and Student ID columns (default: synthetic names)")
+    parser.add_argument("--output", default="synthetic_dataset.csv", help="output .csv or .parquet file")
+    parser.add_argument("--students", type=int, default=1000, help="number of synthetic students without --input")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible datasets")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="students generated per chunk")
+    args = parser.parse_args()
+    generate_synthetic_dataset(args.input, args.output, args.students, seed=args.seed, chunk_size=args.chunk_size)
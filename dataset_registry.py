@@ -0,0 +1,88 @@
+import threading
+import time
+import weakref
+import pandas as pd
+
+class DatasetLease:
+    """A session's reference to a shared dataset, released explicitly or when the lease is garbage collected."""
+
+    def __init__(self, registry, key, df):
+        self.key = key
+        self.df = df
+        # The callback must not hold the lease itself, or it would never be collected
+        self._finalizer = weakref.finalize(self, registry.release, key)
+
+    def release(self):
+        """Gives the reference back to the registry; calling it again does nothing."""
+        self._finalizer()
+
+class DatasetRegistry:
+    """One read-only copy of each loaded dataset, keyed by content hash and shared by every session.
+
+    Sessions hold a `DatasetLease` per dataset. Datasets no session references are
+    kept for `idle_seconds` so a reload is instant, and at most `max_idle` of them are
+    kept at all. Frames handed out must be treated as read-only; with pandas'
+    copy-on-write, filters and column changes made from them never touch the shared copy.
+    """
+
+    def __init__(self, idle_seconds=15 * 60, max_idle=4):
+        self.idle_seconds = idle_seconds
+        self.max_idle = max_idle
+        self._entries = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, load):
+        """Returns a lease on the dataset stored under `key`, calling `load()` to create it if needed."""
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        # Concurrent sessions uploading the same file wait for a single load
+        with loading:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["refs"] += 1
+                    entry["last_used"] = time.monotonic()
+                    return DatasetLease(self, key, entry["df"])
+
+            df = load()
+            with self._lock:
+                self._entries[key] = {"df": df, "refs": 1, "last_used": time.monotonic()}
+                self._evict_idle()
+        return DatasetLease(self, key, df)
+
+    def release(self, key):
+        """Drops one reference to `key` and evicts datasets that have been idle too long."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["refs"] = max(0, entry["refs"] - 1)
+                entry["last_used"] = time.monotonic()
+            self._evict_idle()
+
+    def _evict_idle(self):
+        """Removes unreferenced datasets past `idle_seconds`, then the oldest beyond `max_idle`. Needs the lock."""
+        now = time.monotonic()
+        idle = sorted((entry["last_used"], key) for key, entry in self._entries.items() if entry["refs"] == 0)
+        expired = [key for last_used, key in idle if now - last_used > self.idle_seconds]
+        expired += [key for _, key in idle[:max(0, len(idle) - self.max_idle)] if key not in expired]
+        for key in expired:
+            del self._entries[key]
+            self._loading.pop(key, None)
+
+    def stats(self):
+        """Returns the key, reference count, idle time and memory of every registered dataset."""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._entries.items())
+        return pd.DataFrame([
+            {
+                "Dataset": key[:12],
+                "Rows": len(entry["df"]),
+                "Sessions": entry["refs"],
+                "Idle (s)": round(now - entry["last_used"]) if entry["refs"] == 0 else 0,
+                "Memory (MB)": round(entry["df"].memory_usage(deep=True).sum() / (1024 * 1024), 1)
+            }
+            for key, entry in entries
+        ], columns=["Dataset", "Rows", "Sessions", "Idle (s)", "Memory (MB)"])
@@ -1,7 +1,21 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from fpdf import FPDF
+import io
 import os
+import threading
+import zipfile
+from report_cache import student_fingerprint
+from jobs import process_pool
+from profiling import timed
+from progression import progression_table
+
+# Bump whenever the report layout or chart changes so cached reports are rebuilt
+TEMPLATE_VERSION = 3
+
+# Chart styles: "raster" embeds a PNG from the Agg template, "vector" draws with FPDF primitives
+CHART_STYLES = ("raster", "vector")
 
 class PDF(FPDF):
     def header(self):
@@ -17,31 +31,74 @@ class PDF(FPDF):
         self.cell(200, 10, f"Overall Performance: {overall_performance}", ln=True)
         self.ln(10)
 
-    def add_table(self, df):
-        """Add subject-wise marks table to the PDF."""
+    def add_table(self, progression):
+        """Add the subject-wise table of best marks, attempts and latest grade to the PDF."""
         self.set_font("Arial", "B", 10)
-        col_widths = [60, 30, 30, 50]  # Subject, Marks, Grade, Remarks
+        col_widths = [50, 25, 25, 30, 50]  # Subject, Best Marks, Attempts, Grade, Remarks
 
         # Table header
-        headers = ["Subject", "Marks", "Grade", "Remarks"]
+        headers = ["Subject", "Best Marks", "Attempts", "Grade", "Remarks"]
         for i, header in enumerate(headers):
             self.cell(col_widths[i], 10, header, border=1, align="C")
         self.ln()
 
         # Table rows
         self.set_font("Arial", "", 10)
-        for _, row in df.iterrows():
+        for _, row in progression.iterrows():
             self.cell(col_widths[0], 10, row["Subject"], border=1)
-            self.cell(col_widths[1], 10, str(row["Marks"]), border=1, align="C")
-            self.cell(col_widths[2], 10, row["Grade"], border=1, align="C")
-            self.cell(col_widths[3], 10, get_remarks(row["Marks"]), border=1, align="C")
+            self.cell(col_widths[1], 10, str(row["Best Marks"]), border=1, align="C")
+            self.cell(col_widths[2], 10, str(row["Attempts"]), border=1, align="C")
+            self.cell(col_widths[3], 10, row["Latest Grade"], border=1, align="C")
+            self.cell(col_widths[4], 10, get_remarks(row["Best Marks"]), border=1, align="C")
             self.ln()
 
         self.ln(10)  # Space before graph
 
-    def add_graph(self, img_path):
-        """Insert the performance graph below the table."""
-        self.image(img_path, x=15, w=180, h=80)
+    def add_graph(self, img):
+        """Insert the performance graph (a file path or in-memory PNG buffer) below the table."""
+        self.image(img, x=15, w=180, h=80)
+        self.ln(10)
+
+    def add_bar_chart(self, student_name, subjects, marks):
+        """Draw the performance bar chart with vector primitives in the same box as `add_graph`."""
+        x, y, w, h = 15, self.get_y(), 180, 80
+        if y + h > self.page_break_trigger:
+            self.add_page()
+            y = self.get_y()
+
+        positions, labels = pd.factorize(pd.Series(subjects))
+        top = max(100, max(marks, default=0))
+        plot_x, plot_y, plot_w, plot_h = x + 12, y + 10, w - 17, h - 22
+        slot = plot_w / max(len(labels), 1)
+
+        self.set_font("Arial", "B", 10)
+        self.set_xy(x, y)
+        self.cell(w, 6, f"Performance of {student_name}", align="C")
+
+        # Axes and y-axis ticks
+        self.set_font("Arial", "", 7)
+        self.set_draw_color(0, 0, 0)
+        self.line(plot_x, plot_y, plot_x, plot_y + plot_h)
+        self.line(plot_x, plot_y + plot_h, plot_x + plot_w, plot_y + plot_h)
+        for tick in range(0, int(top) + 1, 20):
+            tick_y = plot_y + plot_h - plot_h * tick / top
+            self.line(plot_x - 1, tick_y, plot_x, tick_y)
+            self.set_xy(x, tick_y - 2)
+            self.cell(10, 4, str(tick), align="R")
+
+        # One slot per subject; repeated subjects would share it
+        self.set_fill_color(135, 206, 235)  # skyblue
+        for position, value in zip(positions, marks):
+            bar_h = plot_h * value / top
+            self.rect(plot_x + slot * (position + 0.1), plot_y + plot_h - bar_h, slot * 0.8, bar_h, style="F")
+        for position, label in enumerate(labels):
+            self.set_xy(plot_x + slot * position, plot_y + plot_h + 1)
+            self.cell(slot, 4, str(label), align="C")
+
+        self.set_font("Arial", "", 8)
+        self.set_xy(x, y + h - 6)
+        self.cell(w, 5, "Subjects", align="C")
+        self.set_y(y + h)
         self.ln(10)
 
 def get_remarks(marks):
@@ -55,41 +112,214 @@ def get_remarks(marks):
     else:
         return "Needs effort."
 
-def generate_report(student_name, df):
-    """Generates a detailed PDF report for a student's performance across subjects."""
-    student_df = df[df["Student Name"] == student_name]
-
-    # Calculate overall performance
-    avg_marks = student_df["Marks"].mean()
+def get_overall_performance(avg_marks):
+    """Classifies a student's average marks as Strong, Average or Weak."""
     if avg_marks >= 75:
-        overall_performance = "Strong"
+        return "Strong"
     elif avg_marks >= 50:
-        overall_performance = "Average"
+        return "Average"
     else:
-        overall_performance = "Weak"
-
-    # Generate Bar Chart
-    plt.figure(figsize=(6, 4))
-    plt.bar(student_df["Subject"], student_df["Marks"], color="skyblue")
-    plt.xlabel("Subjects")
-    plt.ylabel("Marks")
-    plt.title(f"Performance of {student_name}")
-    plt.xticks(rotation=45)
-
-    img_path = f"{student_name}_graph.png"
-    plt.savefig(img_path, bbox_inches="tight")
-    plt.close()
-
-    # Create PDF
-    pdf = PDF()
+        return "Weak"
+
+class ChartTemplate:
+    """A pre-built Agg figure whose bars, ticks and title are updated for each student.
+
+    It avoids pyplot's global state, so each thread can own one (see `render_chart`).
+    """
+
+    def __init__(self):
+        self.figure = Figure(figsize=(6, 4))
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_xlabel("Subjects")
+        self.axes.set_ylabel("Marks")
+        # Fixed margins leave room for the rotated labels instead of bbox_inches="tight"
+        self.figure.subplots_adjust(left=0.12, right=0.97, top=0.9, bottom=0.33)
+        self.bars = None
+
+    def render(self, student_name, subjects, marks):
+        """Draws the chart for one student and returns it as an in-memory PNG buffer."""
+        positions, labels = pd.factorize(pd.Series(subjects))
+        marks = list(marks)
+
+        if self.bars is not None and len(self.bars) == len(marks):
+            for bar, position, height in zip(self.bars, positions, marks):
+                bar.set_x(position - bar.get_width() / 2)
+                bar.set_height(height)
+        else:
+            if self.bars is not None:
+                self.bars.remove()
+            self.bars = self.axes.bar(positions, marks, color="skyblue")
+
+        self.axes.set_xticks(range(len(labels)), [str(label) for label in labels], rotation=45, ha="right")
+        self.axes.set_xlim(-0.6, len(labels) - 0.4)
+        self.axes.set_ylim(0, max(100, max(marks, default=0)) * 1.05)
+        self.axes.set_title(f"Performance of {student_name}")
+
+        buffer = io.BytesIO()
+        self.canvas.print_png(buffer)
+        buffer.seek(0)
+        return buffer
+
+_templates = threading.local()
+
+@timed()
+def render_chart(student_name, progression):
+    """Draws the bar chart of best marks per subject into an in-memory PNG buffer using this thread's template."""
+    if not hasattr(_templates, "chart"):
+        _templates.chart = ChartTemplate()
+    return _templates.chart.render(student_name, progression["Subject"], progression["Best Marks"])
+
+def add_report_pages(pdf, student_name, student_df, chart=None, chart_style="raster", progression=None):
+    """Appends one student's report to `pdf`, rendering the chart unless one is passed in.
+
+    The table and chart show each subject's best attempt, taken from `progression`
+    or derived from `student_df` when it is not given.
+    """
+    if progression is None:
+        progression = progression_table(student_df)
     pdf.add_page()
-    pdf.add_student_info(student_name, overall_performance)
-    pdf.add_table(student_df)
-    pdf.add_graph(img_path)
+    pdf.add_student_info(student_name, get_overall_performance(progression["Best Marks"].mean()))
+    pdf.add_table(progression)
+    if chart_style == "vector":
+        pdf.add_bar_chart(student_name, progression["Subject"], progression["Best Marks"].tolist())
+    else:
+        pdf.add_graph(chart if chart is not None else render_chart(student_name, progression))
+    return pdf
+
+@timed()
+def render_report(student_name, student_df, chart_style="raster", progression=None):
+    """Renders a student's PDF report and returns it as bytes, without touching the disk."""
+    return bytes(add_report_pages(PDF(), student_name, student_df, chart_style=chart_style,
+                                  progression=progression).output())
+
+def _cache_key(student_df, kind="pdf"):
+    """Builds the report cache key for a student's rows and artefact kind ("pdf", "vector.pdf" or "png")."""
+    return f"{student_fingerprint(student_df, TEMPLATE_VERSION)}.{kind}"
+
+@timed()
+def report_bytes(student_name, df, store=None, cache=None, chart_style="raster"):
+    """Returns a student's PDF report as bytes, without touching the working directory.
 
+    With an `AggregateStore` the student's rows and progression are looked up instead of
+    scanning `df`. With a `ReportCache` an unchanged student's report is reused instead of re-rendered.
+    `chart_style` is "raster" (Agg PNG) or "vector" (drawn with FPDF, no image).
+    """
+    if store is not None:
+        student_df = store.select(df, student_name)
+        progression = store.progression_for(student_name)
+    else:
+        student_df = df[df["Student Name"] == student_name]
+        progression = None
+
+    if cache is None:
+        return render_report(student_name, student_df, chart_style, progression)
+    kind = "vector.pdf" if chart_style == "vector" else "pdf"
+    return cache.get_or_render(
+        _cache_key(student_df, kind),
+        lambda: render_report(student_name, student_df, chart_style, progression)
+    )
+
+def generate_report(student_name, df, store=None, cache=None, chart_style="raster"):
+    """Generates a detailed PDF report for a student's performance across subjects and saves it (see `report_bytes`)."""
     # Save Report
     pdf_path = f"{student_name}_report.pdf"
-    pdf.output(pdf_path)
-    os.remove(img_path)  # Clean up the graph image after saving
+    with open(pdf_path, "wb") as file:
+        file.write(report_bytes(student_name, df, store, cache, chart_style))
 
     return pdf_path
+
+def _render_task(task):
+    """Process-pool entry point: renders a full PDF or, for kind "png", just the chart for one student."""
+    student_name, student_df, progression, kind = task
+    if kind == "png":
+        return render_chart(student_name, progression).getvalue()
+    return render_report(student_name, student_df, "vector" if kind == "vector.pdf" else "raster", progression)
+
+@timed()
+def generate_reports(df, students=None, output="zip", dest=None, workers=None, cache=None, chart_style="raster",
+                     progress=None):
+    """Generates reports for many students at once.
+
+    `students` limits the batch (default: everyone). `output` is "zip" for one PDF per
+    student inside a ZIP archive, or "pdf" for a single merged PDF. Charts/reports are
+    rendered across `workers` processes. The result is written to `dest` (a path or
+    binary file object) or returned as bytes when `dest` is None. With a `ReportCache`
+    only students whose data changed are rendered again. `chart_style` is passed on
+    to every report. `progress(done, total)` is called as each report is rendered.
+    """
+    if output not in ("zip", "pdf"):
+        raise ValueError("output must be 'zip' or 'pdf'")
+    if chart_style not in CHART_STYLES:
+        raise ValueError(f"chart_style must be one of {CHART_STYLES}")
+
+    # Merged PDFs only need the charts from the workers, and vector charts need nothing
+    if output == "pdf":
+        kind = None if chart_style == "vector" else "png"
+    else:
+        kind = "vector.pdf" if chart_style == "vector" else "pdf"
+
+    groups = df.groupby("Student Name", observed=True, sort=False)
+    if students is None:
+        students = list(groups.groups)
+    # One progression pass over the batch, instead of one per student
+    selected = df if len(students) == len(groups.groups) else df[df["Student Name"].isin(students)]
+    progressions = progression_table(selected).groupby("Student Name", observed=True, sort=False)
+    tasks = [(name, groups.get_group(name), progressions.get_group(name), kind) for name in students if name in groups.groups]
+
+    keys = [_cache_key(student_df, kind) if cache is not None and kind else None for _, student_df, _, _ in tasks]
+    pending = [i for i, key in enumerate(keys) if kind and (key is None or not cache.has(key))]
+    pending_tasks = [tasks[i] for i in pending]
+
+    def reports(results):
+        """Yields each student's report or chart in batch order, taking fresh renders from `results` as they arrive."""
+        results = iter(results)
+        fresh = set(pending)
+        done = 0
+        for i, key in enumerate(keys):
+            if not kind:
+                data = None
+            elif i in fresh:
+                data = next(results)
+                if key is not None:
+                    # Cached as it arrives, so a batch stopped early keeps what it rendered
+                    data = cache.put(key, data)
+                done += 1
+                if progress is not None:
+                    progress(done, len(pending))
+            else:
+                data = cache.get(key)
+                if data is None:  # Evicted since the batch started
+                    data = cache.put(key, _render_task(tasks[i]))
+            yield data
+
+    def write(results):
+        """Writes each report into the target as it is produced instead of collecting the whole batch first."""
+        if output == "zip":
+            # PDFs are already compressed, so the archive only stores them
+            with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED) as archive:
+                for (name, _, _, _), report in zip(tasks, reports(results)):
+                    archive.writestr(f"{name}_report.pdf", report)
+        else:
+            pdf = PDF()
+            for (name, student_df, progression, _), chart in zip(tasks, reports(results)):
+                add_report_pages(pdf, name, student_df, chart and io.BytesIO(chart), chart_style, progression)
+            if isinstance(target, (str, os.PathLike)):
+                pdf.output(target)
+            else:
+                target.write(pdf.output())
+
+    target = io.BytesIO() if dest is None else dest
+    if workers and workers > 1 and len(pending_tasks) > 1:
+        with process_pool(workers) as executor:
+            try:
+                write(executor.map(_render_task, pending_tasks, chunksize=max(1, len(pending_tasks) // (workers * 4))))
+            except BaseException:
+                executor.shutdown(cancel_futures=True)  # Drop queued renders instead of waiting for them
+                raise
+    else:
+        write(map(_render_task, pending_tasks))
+
+    if dest is None:
+        return target.getvalue()
+    return dest
@@ -0,0 +1,147 @@
+import contextvars
+import multiprocessing
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pandas as pd
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+def process_pool(workers):
+    """Returns a process pool whose workers start fresh rather than forked, so threaded callers
+    such as the dashboard's jobs or the pipeline's stages never fork a copy of held locks."""
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+class JobCancelled(Exception):
+    """Raised inside a job's work when cancellation has been requested."""
+
+class Job:
+    """A unit of background work with an ID, progress, and a result or error once finished."""
+
+    def __init__(self, key, name, cancellable=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.name = name
+        self.cancellable = cancellable
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._future = None
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def update(self, done, total, message=None):
+        """Records progress as `done` of `total` steps; raises JobCancelled if the job should stop."""
+        self.progress = min(1.0, done / total) if total else 1.0
+        if message is not None:
+            self.message = message
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        """Stops a queued job immediately and asks a running cancellable one to stop at its next progress update."""
+        if not self.cancellable and self.status == RUNNING:
+            return
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self._finish(CANCELLED)
+
+    def wait(self, timeout=None):
+        """Blocks until the job finishes or `timeout` seconds pass; returns whether it finished."""
+        return self._done.wait(timeout)
+
+    def _finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self._done.set()
+
+class JobManager:
+    """Runs jobs on a thread pool, keyed by what they compute so repeated requests share one job.
+
+    Work functions are called as `fn(job, *args, **kwargs)` and may call `job.update()`
+    to report progress and honour cancellation. Finished jobs keep their results, so a
+    rerun asking for the same key gets the cached result instead of recomputing; only
+    the `max_finished` most recent are kept.
+    """
+
+    def __init__(self, max_workers=2, max_finished=32):
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, name=None, retry=False, cancellable=False, **kwargs):
+        """Returns the job for `key`, starting `fn` in the background if there is none.
+
+        A failed or cancelled job is returned as is, so its outcome can be shown,
+        unless `retry` is set, in which case it is started again. Only mark a job
+        `cancellable` if `fn` calls `job.update()` while it works.
+        """
+        with self._lock:
+            job = self._jobs.get(self._by_key.get(key))
+            if job is not None and not (retry and job.status in (FAILED, CANCELLED)):
+                self._jobs.move_to_end(job.id)
+                return job
+
+            job = Job(key, name or getattr(fn, "__name__", "job"), cancellable)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._prune()
+        # Stage timings recorded by the work go to the submitting context's log
+        context = contextvars.copy_context()
+        job._future = self._executor.submit(context.run, self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """Returns the job with `job_id`, or None if it is unknown or was pruned."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """Returns every tracked job, oldest first."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def summary(self):
+        """Returns the ID, name, status and progress of every tracked job."""
+        return pd.DataFrame(
+            [(job.id, job.name, job.status, round(job.progress * 100)) for job in self.jobs()],
+            columns=["Job", "Name", "Status", "Progress (%)"]
+        )
+
+    def _run(self, job, fn, args, kwargs):
+        if job._cancel.is_set():
+            job._finish(CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            job._finish(CANCELLED)
+        except Exception as e:
+            job._finish(FAILED, error=e)
+        else:
+            job.progress = 1.0
+            job._finish(DONE, result=result)
+
+    def _prune(self):
+        """Forgets the oldest finished jobs beyond `max_finished`. Needs the lock."""
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
@@ -1,57 +1,342 @@
 import pandas as pd
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+from jobs import process_pool
+from profiling import timed
+from progression import progression_table
 
-def pair_students_by_subject(df):
-    """Pairs weak students with strong performers for knowledge sharing within the same subject."""
+WEAK_GRADES = ['E', 'F']
+STRONG_GRADES = ['A', 'S']
+
+# Largest problem the exact solver takes under method="auto", counted as weak x mentor-slot
+# cells, or as in-band edges when a band is set; bigger problems use the greedy sorted merge.
+# Raise it for quality, lower it for speed.
+EXACT_LIMIT = 4_000_000
+
+def _cost_matrix(weak_marks, strong_marks):
+    """Builds the weak x strong cost matrix (-abs(mark difference)) in one broadcast."""
+    weak_marks = np.asarray(weak_marks, dtype=float)
+    strong_marks = np.asarray(strong_marks, dtype=float)
+    return -np.abs(weak_marks[:, None] - strong_marks[None, :])
+
+def _band_edges(weak_marks, strong_marks, band):
+    """Lists every (weak, strong) position pair whose marks differ by at most `band`, via a sorted search."""
+    order = np.argsort(strong_marks, kind="stable")
+    sorted_strong = strong_marks[order]
+    lo = np.searchsorted(sorted_strong, weak_marks - band, side="left")
+    hi = np.searchsorted(sorted_strong, weak_marks + band, side="right")
+    counts = hi - lo
+    rows = np.repeat(np.arange(len(weak_marks)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, order[np.repeat(lo, counts) + offsets]
+
+def _banded_assignment(weak_marks, strong_marks, band):
+    """Assigns weak to strong students only where the mark difference is within `band`.
+
+    Matches as many weak students as the band allows and, among those matchings,
+    maximises the total mark difference like the dense path, in one sparse solve.
+    """
+    weak_marks = np.asarray(weak_marks, dtype=float)
+    strong_marks = np.asarray(strong_marks, dtype=float)
+    rows, cols = _band_edges(weak_marks, strong_marks, band)
+    if rows.size == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty
+
+    # Each weak student also gets a private dummy partner, so a full matching always
+    # exists. A dummy costs more than any set of real edges could save, so the solver
+    # first matches as many students as possible and only then widens the gaps.
+    # Real costs are shifted to stay positive because the solver drops explicit zeros.
+    n_weak, n_strong = len(weak_marks), len(strong_marks)
+    costs = band + 1 - np.abs(weak_marks[rows] - strong_marks[cols])
+    dummy_cost = (min(n_weak, n_strong) + 1) * (band + 1) + 1
+    graph = csr_matrix(
+        (np.concatenate([costs, np.full(n_weak, dummy_cost)]),
+         (np.concatenate([rows, np.arange(n_weak)]), np.concatenate([cols, n_strong + np.arange(n_weak)]))),
+        shape=(n_weak, n_strong + n_weak)
+    )
+    row_ind, col_ind = min_weight_full_bipartite_matching(graph)
+    real = col_ind < n_strong
+    return row_ind[real], col_ind[real]
+
+@timed()
+def _assign(weak_marks, strong_marks, band=None):
+    """Returns matched (weak, strong) positions, dense Hungarian unless a mark band is given."""
+    if band is None:
+        return linear_sum_assignment(_cost_matrix(weak_marks, strong_marks))
+    return _banded_assignment(weak_marks, strong_marks, band)
+
+def _exact_match(weak_marks, strong_marks, capacity=1, band=None):
+    """Optimal matching: each mentor is replicated `capacity` times so a 1:1 assignment gives up to k mentees each."""
+    row_ind, col_ind = _assign(weak_marks, np.repeat(strong_marks, capacity), band)
+    return row_ind, col_ind // capacity
+
+def _available(parent, i):
+    """Finds the nearest mentor at or below sorted position `i` with capacity left (-1 if none)."""
+    root = i
+    while root >= 0 and parent[root] != root:
+        root = parent[root]
+    while i >= 0 and parent[i] != i:  # Path compression
+        parent[i], i = root, parent[i]
+    return root
+
+def _greedy_match(weak_marks, strong_marks, capacity=1, band=None):
+    """Sorted-merge approximation in O((W + S) log S): the weakest students take the strongest free mentor slots.
+
+    Without a band this reaches the same objective as the exact solver; within a band
+    each student takes the strongest mentor in reach, which may leave others unmatched.
+    """
+    weak_marks = np.asarray(weak_marks, dtype=float)
+    strong_marks = np.asarray(strong_marks, dtype=float)
+    weak_order = np.argsort(weak_marks, kind="stable")
+
+    if band is None:
+        slots = np.repeat(np.argsort(-strong_marks, kind="stable"), capacity)
+        n = min(len(weak_order), len(slots))
+        rows, cols = weak_order[:n], slots[:n]
+    else:
+        order = np.argsort(strong_marks, kind="stable")
+        sorted_strong = strong_marks[order]
+        highest = np.searchsorted(sorted_strong, weak_marks[weak_order] + band, side="right") - 1
+        remaining = np.full(len(order), capacity)
+        parent = np.arange(len(order))
+        rows, cols = [], []
+        for row, top in zip(weak_order, highest):
+            j = _available(parent, top) if top >= 0 else -1
+            if j < 0 or sorted_strong[j] < weak_marks[row] - band:
+                continue
+            rows.append(row)
+            cols.append(order[j])
+            remaining[j] -= 1
+            if remaining[j] == 0:
+                parent[j] = j - 1
+        rows, cols = np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+    by_row = np.argsort(rows, kind="stable")
+    return rows[by_row], cols[by_row]
+
+# Matching strategies by name; each takes (weak marks, strong marks, capacity, band)
+# and returns matched (weak, strong) positions
+MATCHERS = {"exact": _exact_match, "greedy": _greedy_match}
+
+def register_matcher(name, matcher):
+    """Makes a custom matching strategy available as `method=name`."""
+    MATCHERS[name] = matcher
+
+def _problem_size(weak_marks, strong_marks, capacity=1, band=None):
+    """Counts what the exact solver works on: every weak x mentor-slot cell, or only the in-band edges."""
+    if band is None:
+        return len(weak_marks) * len(strong_marks) * capacity
+    weak_marks = np.asarray(weak_marks, dtype=float)
+    sorted_strong = np.sort(np.asarray(strong_marks, dtype=float))
+    lo = np.searchsorted(sorted_strong, weak_marks - band, side="left")
+    hi = np.searchsorted(sorted_strong, weak_marks + band, side="right")
+    return int((hi - lo).sum()) * capacity
+
+def match(weak_marks, strong_marks, capacity=1, band=None, method="auto", exact_limit=EXACT_LIMIT):
+    """Matches weak students to mentors with up to `capacity` mentees each.
+
+    `method` names a strategy in MATCHERS; "auto" uses "exact" while the problem (see
+    `_problem_size`) has at most `exact_limit` cells or edges and "greedy" beyond that.
+    """
+    if method == "auto":
+        method = "exact" if _problem_size(weak_marks, strong_marks, capacity, band) <= exact_limit else "greedy"
+    if method not in MATCHERS:
+        raise ValueError(f"method must be 'auto' or one of {sorted(MATCHERS)}")
+    return MATCHERS[method](weak_marks, strong_marks, capacity, band)
+
+def _pair_subject(subject, weak_names, weak_marks, strong_names, strong_marks, band=None, capacity=1,
+                  method="auto", exact_limit=EXACT_LIMIT):
+    """Runs the weak/strong assignment for a single subject."""
+    row_ind, col_ind = match(weak_marks, strong_marks, capacity, band, method, exact_limit)
+    return pd.DataFrame({
+        'Subject': subject,
+        'Weak Student': weak_names[row_ind],
+        'Weak Student Marks': weak_marks[row_ind],
+        'Strong Student': strong_names[col_ind],
+        'Strong Student Marks': strong_marks[col_ind]
+    })
+
+def _subject_partitions(df):
+    """Splits the frame once into (subject, weak names, weak marks, strong names, strong marks).
+
+    Rows whose marks are missing (e.g. an unreadable "AB") are left out of both sides.
+    """
+    has_marks = df['Marks'].notna().to_numpy()
+    is_weak = df['Grade'].isin(WEAK_GRADES).to_numpy() & has_marks
+    is_strong = df['Grade'].isin(STRONG_GRADES).to_numpy() & has_marks
+    names = df['Student Name'].to_numpy()
+    marks = df['Marks'].to_numpy()
+
+    for subject, positions in df.groupby('Subject', sort=False, observed=True).indices.items():
+        weak_pos = positions[is_weak[positions]]
+        strong_pos = positions[is_strong[positions]]
+        if len(weak_pos) and len(strong_pos):
+            yield subject, names[weak_pos], marks[weak_pos], names[strong_pos], marks[strong_pos]
+
+@timed()
+def pair_students_by_subject(df, band=None, workers=None, capacity=1, method="auto", exact_limit=EXACT_LIMIT,
+                             progress=None):
+    """Pairs weak students with strong performers for knowledge sharing within the same subject.
+
+    When `band` is set, students are only paired if their marks differ by at most `band`.
+    Each strong student mentors up to `capacity` weak students; `method` and
+    `exact_limit` pick the matching strategy (see `match`).
+    With `workers` > 1 the subjects are solved in parallel across a process pool.
+    `progress(done, total)` is called as each subject is paired.
+    """
+    partitions = list(_subject_partitions(df))
+    options = (band, capacity, method, exact_limit)
     pairs = []
-    
-    for subject in df['Subject'].unique():
-        poor = df[(df['Subject'] == subject) & (df['Grade'].isin(['E', 'F']))]
-        strong = df[(df['Subject'] == subject) & (df['Grade'].isin(['A', 'S']))]
-
-        if not poor.empty and not strong.empty:
-            cost_matrix = np.zeros((len(poor), len(strong)))
-            for i, (_, p) in enumerate(poor.iterrows()):
-                for j, (_, s) in enumerate(strong.iterrows()):
-                    cost_matrix[i, j] = -abs(p['Marks'] - s['Marks'])
-
-            row_ind, col_ind = linear_sum_assignment(cost_matrix)
-
-            for r, c in zip(row_ind, col_ind):
-                pairs.append({
-                    'Subject': subject,
-                    'Weak Student': poor.iloc[r]['Student Name'],
-                    'Weak Student Marks': poor.iloc[r]['Marks'],
-                    'Strong Student': strong.iloc[c]['Student Name'],
-                    'Strong Student Marks': strong.iloc[c]['Marks']
-                })
-    
-    return pd.DataFrame(pairs)
-
-def pair_students_overall(df):
-    """Pairs weak students with strong performers based on overall performance across all subjects."""
-    avg_marks = df.groupby('Student Name')['Marks'].mean().reset_index()
+
+    def collect(results):
+        for result in results:
+            pairs.append(result)
+            if progress is not None:
+                progress(len(pairs), len(partitions))
+
+    if workers and workers > 1 and len(partitions) > 1:
+        with process_pool(workers) as executor:
+            futures = [executor.submit(_pair_subject, *part, *options) for part in partitions]
+            try:
+                collect(future.result() for future in futures)
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+    else:
+        collect(_pair_subject(*part, *options) for part in partitions)
+
+    if not pairs:
+        return pd.DataFrame()
+    return pd.concat(pairs, ignore_index=True)
+
+@timed()
+def pair_students_overall(df, band=None, capacity=1, method="auto", exact_limit=EXACT_LIMIT):
+    """Pairs weak students with strong performers based on overall performance across all subjects.
+
+    When `band` is set, students are only paired if their averages differ by at most `band`.
+    Each strong student mentors up to `capacity` weak students; `method` and
+    `exact_limit` pick the matching strategy (see `match`).
+    Missing marks are skipped, and students with no marks at all are not paired.
+    """
+    avg_marks = df.groupby('Student Name', observed=True)['Marks'].mean().dropna().reset_index()
     avg_marks['Performance'] = pd.qcut(avg_marks['Marks'], q=3, labels=["Weak", "Medium", "Strong"])
-    
+
     weak_students = avg_marks[avg_marks['Performance'] == "Weak"]
     strong_students = avg_marks[avg_marks['Performance'] == "Strong"]
-    
-    pairs = []
-    if not weak_students.empty and not strong_students.empty:
-        cost_matrix = np.zeros((len(weak_students), len(strong_students)))
-        for i, (_, w) in enumerate(weak_students.iterrows()):
-            for j, (_, s) in enumerate(strong_students.iterrows()):
-                cost_matrix[i, j] = -abs(w['Marks'] - s['Marks'])
-        
-        row_ind, col_ind = linear_sum_assignment(cost_matrix)
-        
-        for r, c in zip(row_ind, col_ind):
-            pairs.append({
-                'Weak Student': weak_students.iloc[r]['Student Name'],
-                'Weak Student Avg Marks': weak_students.iloc[r]['Marks'],
-                'Strong Student': strong_students.iloc[c]['Student Name'],
-                'Strong Student Avg Marks': strong_students.iloc[c]['Marks']
-            })
-    
-    return pd.DataFrame(pairs)
+
+    if weak_students.empty or strong_students.empty:
+        return pd.DataFrame()
+
+    row_ind, col_ind = match(weak_students['Marks'].to_numpy(), strong_students['Marks'].to_numpy(), capacity, band,
+                             method, exact_limit)
+
+    return pd.DataFrame({
+        'Weak Student': weak_students['Student Name'].to_numpy()[row_ind],
+        'Weak Student Avg Marks': weak_students['Marks'].to_numpy()[row_ind],
+        'Strong Student': strong_students['Student Name'].to_numpy()[col_ind],
+        'Strong Student Avg Marks': strong_students['Marks'].to_numpy()[col_ind]
+    })
+
+def _subject_lists(matrix, subjects):
+    """Turns each row of a student x subject boolean matrix into a comma-separated subject list."""
+    if not len(matrix):
+        return np.array([], dtype=object)
+    patterns, inverse = np.unique(matrix, axis=0, return_inverse=True)
+    names = np.array([", ".join(subjects[row]) for row in patterns], dtype=object)
+    return names[inverse.ravel()]
+
+def _exact_cover_match(weak_matrix, strong_matrix, weak_avg, strong_avg, capacity):
+    """Optimal many-to-one matching on shared weak/strong subjects, then mark difference, over replicated mentors."""
+    coverage = weak_matrix.astype(np.int32) @ strong_matrix.T.astype(np.int32)
+    gap = np.abs(weak_avg[:, None] - strong_avg[None, :])
+    # Covered subjects dominate; the mark difference (at most 100) only breaks ties
+    score = np.where(coverage > 0, coverage * 101.0 + gap, 0.0)
+    row_ind, col_ind = linear_sum_assignment(-np.repeat(score, capacity, axis=1))
+    col_ind //= capacity
+    keep = coverage[row_ind, col_ind] > 0
+    return row_ind[keep], col_ind[keep]
+
+def _greedy_cover_match(weak_matrix, strong_matrix, weak_avg, strong_avg, capacity):
+    """Greedy matching over subject patterns: pattern pairs sharing the most subjects are merged first,
+    weakest students with the strongest mentor slots, so the work grows with the number of patterns."""
+    weak_patterns, weak_group = np.unique(weak_matrix, axis=0, return_inverse=True)
+    strong_patterns, strong_group = np.unique(strong_matrix, axis=0, return_inverse=True)
+    weak_group, strong_group = weak_group.ravel(), strong_group.ravel()
+    coverage = weak_patterns.astype(np.int32) @ strong_patterns.T.astype(np.int32)
+
+    # Members of each pattern, weakest mentees and strongest mentor slots first
+    weak_members = [np.flatnonzero(weak_group == g) for g in range(len(weak_patterns))]
+    weak_members = [m[np.argsort(weak_avg[m], kind="stable")] for m in weak_members]
+    strong_slots = [np.flatnonzero(strong_group == g) for g in range(len(strong_patterns))]
+    strong_slots = [np.repeat(m[np.argsort(-strong_avg[m], kind="stable")], capacity) for m in strong_slots]
+    weak_next = np.zeros(len(weak_members), dtype=int)
+    strong_next = np.zeros(len(strong_slots), dtype=int)
+
+    rows, cols = [], []
+    order = np.argsort(-coverage, axis=None, kind="stable")
+    for w, s in zip(*np.unravel_index(order, coverage.shape)):
+        if coverage[w, s] == 0:
+            break
+        n = min(len(weak_members[w]) - weak_next[w], len(strong_slots[s]) - strong_next[s])
+        if n <= 0:
+            continue
+        rows.append(weak_members[w][weak_next[w]:weak_next[w] + n])
+        cols.append(strong_slots[s][strong_next[s]:strong_next[s] + n])
+        weak_next[w] += n
+        strong_next[s] += n
+
+    if not rows:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    by_row = np.argsort(rows, kind="stable")
+    return rows[by_row], cols[by_row]
+
+@timed()
+def pair_students_multi_subject(df, capacity=1, method="auto", exact_limit=EXACT_LIMIT):
+    """Matches each student to a mentor who is strong in as many of their weak subjects as possible.
+
+    A subject counts as weak or strong by the student's latest grade in it. Ties are
+    broken by the difference in best-attempt averages, and each mentor takes up to
+    `capacity` students. Students weak in any subject are only matched as mentees. `method` is "exact", "greedy" or "auto" (exact up to
+    `exact_limit` weak x mentor-slot cells).
+    """
+    progression = progression_table(df)
+    if progression.empty:
+        return pd.DataFrame()
+
+    grades = progression.pivot_table(index='Student Name', columns='Subject', values='Latest Grade',
+                                     aggfunc='first', observed=True)
+    averages = progression.groupby('Student Name', observed=True)['Best Marks'].mean().reindex(grades.index)
+    subjects = grades.columns.to_numpy()
+    weak_all = grades.isin(WEAK_GRADES).to_numpy()
+    strong_all = grades.isin(STRONG_GRADES).to_numpy()
+
+    weak = weak_all.any(axis=1)
+    strong = strong_all.any(axis=1) & ~weak
+    if not weak.any() or not strong.any():
+        return pd.DataFrame()
+
+    weak_matrix, strong_matrix = weak_all[weak], strong_all[strong]
+    weak_avg, strong_avg = averages.to_numpy()[weak], averages.to_numpy()[strong]
+    if method == "auto":
+        method = "exact" if weak.sum() * strong.sum() * capacity <= exact_limit else "greedy"
+    if method == "exact":
+        row_ind, col_ind = _exact_cover_match(weak_matrix, strong_matrix, weak_avg, strong_avg, capacity)
+    elif method == "greedy":
+        row_ind, col_ind = _greedy_cover_match(weak_matrix, strong_matrix, weak_avg, strong_avg, capacity)
+    else:
+        raise ValueError("method must be 'auto', 'exact' or 'greedy'")
+
+    names = grades.index.to_numpy()
+    covered = weak_matrix[row_ind] & strong_matrix[col_ind]
+    return pd.DataFrame({
+        'Weak Student': names[weak][row_ind],
+        'Weak Subjects': _subject_lists(weak_matrix[row_ind], subjects),
+        'Weak Student Avg Marks': weak_avg[row_ind],
+        'Strong Student': names[strong][col_ind],
+        'Subjects Covered': _subject_lists(covered, subjects),
+        'Strong Student Avg Marks': strong_avg[col_ind]
+    })
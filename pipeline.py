@@ -0,0 +1,127 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Only pandas is imported up front; each stage imports what it needs, so a run that
+# skips reports never loads matplotlib/fpdf and nothing here ever loads Streamlit.
+import pandas as pd
+
+STAGES = ["summaries", "pairings", "recommendations", "reports"]
+
+def ingest(path):
+    """Loads a CSV, Excel or Parquet results file with the dashboard's column names and dtypes."""
+    from data_preprocessing import apply_schema, load_data, standardize_columns
+
+    if path.endswith('.parquet'):
+        return apply_schema(standardize_columns(pd.read_parquet(path)))
+    with open(path, "rb") as file:
+        df = load_data(file)
+    if df is None:
+        raise ValueError(f"Unsupported file type: {path}")
+    return df
+
+def _write(df, output_dir, name):
+    """Writes one output table as Parquet and returns its path."""
+    path = os.path.join(output_dir, f"{name}.parquet")
+    df.to_parquet(path, index=False)
+    return path
+
+def run_summaries(df, store, output_dir):
+    """Writes per-student (with category) and per-subject statistics, attempt progression and the grade histogram."""
+    histogram = store.grade_histogram.reset_index()
+    histogram.columns = [str(column) for column in histogram.columns]
+    return [
+        _write(store.students, output_dir, "student_summary"),
+        _write(store.subjects, output_dir, "subject_summary"),
+        _write(store.progression, output_dir, "progression"),
+        _write(histogram, output_dir, "grade_histogram")
+    ]
+
+def run_pairings(df, store, output_dir, band=None, workers=None, capacity=1, method="auto"):
+    """Writes the by-subject, overall and multi-subject mentor pairings."""
+    from pair import pair_students_by_subject, pair_students_multi_subject, pair_students_overall
+
+    options = {"capacity": capacity, "method": method}
+    return [
+        _write(pair_students_by_subject(df, band=band, workers=workers, **options), output_dir, "pairs_by_subject"),
+        _write(pair_students_overall(df, band=band, **options), output_dir, "pairs_overall"),
+        _write(pair_students_multi_subject(df, **options), output_dir, "pairs_multi_subject")
+    ]
+
+def run_recommendations(df, store, output_dir):
+    """Writes the dataset with its categorical recommendation column."""
+    from recommend import apply_recommendations
+
+    path = os.path.join(output_dir, "recommendations.parquet")
+    apply_recommendations(df, path)
+    return [path]
+
+def run_reports(df, store, output_dir, output="zip", workers=None, chart_style="raster"):
+    """Writes every student's report as a ZIP of PDFs or one merged PDF."""
+    from generate import generate_reports
+
+    path = os.path.join(output_dir, f"reports.{output}")
+    generate_reports(df, output=output, dest=path, workers=workers, chart_style=chart_style)
+    return [path]
+
+def run_pipeline(path, output_dir, stages=STAGES, band=None, workers=None, report_format="zip",
+                 chart_style="raster", capacity=1, method="auto"):
+    """Ingests `path` and runs the selected stages, independent stages concurrently.
+
+    Returns a dict of stage name -> (seconds, written paths).
+    """
+    from aggregates import AggregateStore
+
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    df = ingest(path)
+    store = AggregateStore(df)
+    results = {"ingest": (time.perf_counter() - start, [])}
+
+    runners = {
+        "summaries": lambda: run_summaries(df, store, output_dir),
+        "pairings": lambda: run_pairings(df, store, output_dir, band, workers, capacity, method),
+        "recommendations": lambda: run_recommendations(df, store, output_dir),
+        "reports": lambda: run_reports(df, store, output_dir, report_format, workers, chart_style)
+    }
+
+    def timed(stage):
+        stage_start = time.perf_counter()
+        paths = runners[stage]()
+        return stage, (time.perf_counter() - stage_start, paths)
+
+    # Every stage only reads the ingested frame and store, so they can overlap
+    with ThreadPoolExecutor(max_workers=len(stages) or 1) as executor:
+        for stage, result in executor.map(timed, stages):
+            results[stage] = result
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the student performance analyses without the dashboard.")
+    parser.add_argument("input", help="CSV, Excel or Parquet results file")
+    parser.add_argument("--output-dir", default="pipeline_output", help="directory for Parquet outputs and reports")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated stages from {', '.join(STAGES)}")
+    parser.add_argument("--band", type=float, help="only pair students whose marks differ by at most this much")
+    parser.add_argument("--capacity", type=int, default=1, help="students each mentor may take")
+    parser.add_argument("--method", choices=["auto", "exact", "greedy"], default="auto",
+                        help="matching strategy; auto switches to greedy for large cohorts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for pairing and reports")
+    parser.add_argument("--report-format", choices=["zip", "pdf"], default="zip", help="ZIP of PDFs or one merged PDF")
+    parser.add_argument("--chart-style", choices=["raster", "vector"], default="raster", help="report chart style")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {unknown}")
+
+    results = run_pipeline(args.input, args.output_dir, stages, args.band, args.workers,
+                           args.report_format, args.chart_style, args.capacity, args.method)
+    for stage, (seconds, paths) in results.items():
+        print(f"{stage:<16} {seconds:8.2f}s  {', '.join(paths)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
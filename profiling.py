@@ -0,0 +1,148 @@
+import cProfile
+import functools
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; memory is then left unrecorded
+    resource = None
+
+MAX_RECORDS = 2_000
+
+class StageLog:
+    """Collects stage timings and cache hits/misses, bounded to the most recent MAX_RECORDS stages."""
+
+    def __init__(self, max_records=MAX_RECORDS):
+        self.records = deque(maxlen=max_records)
+        self.cache = {}
+        self.profile = None
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, rows=None, peak_rss_mb=None):
+        """Adds one finished stage."""
+        with self._lock:
+            self.records.append({"stage": stage, "seconds": seconds, "rows": rows, "peak_rss_mb": peak_rss_mb,
+                                 "timestamp": time.time()})
+
+    def cache_event(self, name, hit):
+        """Counts a hit or miss for the named cache."""
+        with self._lock:
+            counts = self.cache.setdefault(name, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def clear(self):
+        """Drops every record, cache count and captured profile."""
+        with self._lock:
+            self.records.clear()
+            self.cache.clear()
+            self.profile = None
+
+    def summary(self):
+        """Returns calls, total/mean/max seconds and rows per stage, slowest first."""
+        with self._lock:
+            records = pd.DataFrame(list(self.records), columns=["stage", "seconds", "rows", "peak_rss_mb", "timestamp"])
+        if records.empty:
+            return pd.DataFrame(columns=["Stage", "Calls", "Total (s)", "Mean (s)", "Max (s)", "Rows", "Peak RSS (MB)"])
+        summary = records.groupby("stage").agg(Calls=("seconds", "size"), Total=("seconds", "sum"),
+                                               Mean=("seconds", "mean"), Max=("seconds", "max"),
+                                               Rows=("rows", "max"), RSS=("peak_rss_mb", "max"))
+        summary = summary.sort_values("Total", ascending=False).reset_index()
+        summary.columns = ["Stage", "Calls", "Total (s)", "Mean (s)", "Max (s)", "Rows", "Peak RSS (MB)"]
+        return summary
+
+    def cache_summary(self):
+        """Returns hits, misses and hit rate per cache."""
+        with self._lock:
+            rows = [(name, c["hits"], c["misses"]) for name, c in self.cache.items()]
+        summary = pd.DataFrame(rows, columns=["Cache", "Hits", "Misses"])
+        summary["Hit Rate"] = summary["Hits"] / (summary["Hits"] + summary["Misses"]).where(lambda n: n > 0)
+        return summary
+
+    def to_json(self):
+        """Serialises the raw records, cache counts and last profile for offline analysis."""
+        with self._lock:
+            document = {"records": list(self.records), "cache": self.cache, "profile": self.profile}
+        return json.dumps(document, indent=2, default=str)
+
+# Stages record into the log bound to the current context (the dashboard binds one per
+# session); anything else, including worker threads, records into the process-wide log
+default_log = StageLog()
+_current_log = ContextVar("stage_log", default=None)
+
+def current_log():
+    """Returns the log stages are recorded into in this context."""
+    return _current_log.get() or default_log
+
+def use_log(log):
+    """Binds `log` to the current context so later stages record into it."""
+    _current_log.set(log)
+    return log
+
+def peak_rss_mb():
+    """Returns the process's peak resident set size so far, in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+@contextmanager
+def stage(name, rows=None):
+    """Times the enclosed block and records it, with `rows` and peak RSS, as stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current_log().record(name, time.perf_counter() - start, rows, peak_rss_mb())
+
+def _row_count(args, kwargs):
+    """Returns the length of the first DataFrame argument, or None."""
+    for value in (*args, *kwargs.values()):
+        if isinstance(value, pd.DataFrame):
+            return len(value)
+    return None
+
+def timed(name=None):
+    """Decorates a function so every call is recorded as a stage, with the rows of its first DataFrame argument."""
+    def decorate(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(label, _row_count(args, kwargs)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def cache_event(name, hit):
+    """Counts a hit or miss for the named cache in the current log."""
+    current_log().cache_event(name, hit)
+
+@contextmanager
+def profile(enabled=True, limit=40):
+    """Captures a cProfile of the enclosed block into the current log's `profile` when `enabled`."""
+    if not enabled:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Another profiler is already active in this process
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(limit)
+        current_log().profile = output.getvalue()
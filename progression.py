@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from profiling import timed
+
+PASS_MARK = 35  # Lowest mark that passes a subject; students below it re-attempt
+
+PROGRESSION_KEYS = ['Student Name', 'Subject']
+PROGRESSION_COLUMNS = PROGRESSION_KEYS + [
+    'Attempts', 'First Marks', 'Best Marks', 'Latest Marks', 'Improvement', 'Last Improvement',
+    'Passed On Attempt', 'Latest Grade'
+]
+
+@timed()
+def progression_table(df, pass_mark=PASS_MARK):
+    """Summarises every (student, subject) over its attempts in one sorted grouped pass.
+
+    Returns one row per pair with the attempt count, first/best/latest marks, the
+    improvement from the first and from the previous attempt, the first attempt at or
+    above `pass_mark` (missing if never passed) and the latest grade.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=PROGRESSION_COLUMNS)
+
+    ordered = df.sort_values(PROGRESSION_KEYS + ['Attempt'], kind='stable')
+    marks = ordered['Marks'].to_numpy()
+
+    # Difference to the previous attempt, left empty where a new (student, subject) begins
+    same_pair = np.ones(len(ordered), dtype=bool)
+    same_pair[0] = False
+    for key in PROGRESSION_KEYS:
+        values = ordered[key].to_numpy()
+        same_pair[1:] &= values[1:] == values[:-1]
+    delta = np.where(same_pair, marks - np.roll(marks, 1), np.nan)
+
+    table = ordered.assign(
+        _delta=delta,
+        _passed=ordered['Attempt'].where(ordered['Marks'] >= pass_mark)
+    ).groupby(PROGRESSION_KEYS, observed=True, sort=False).agg(**{
+        'Attempts': ('Attempt', 'size'),
+        'First Marks': ('Marks', 'first'),
+        'Best Marks': ('Marks', 'max'),
+        'Latest Marks': ('Marks', 'last'),
+        'Last Improvement': ('_delta', 'last'),
+        'Passed On Attempt': ('_passed', 'min'),
+        'Latest Grade': ('Grade', 'last')
+    })
+
+    table['Improvement'] = table['Latest Marks'] - table['First Marks']
+    table['Last Improvement'] = table['Last Improvement'].fillna(0).astype(table['Improvement'].dtype)
+    table['Attempts'] = table['Attempts'].astype(np.int8)
+    table['Passed On Attempt'] = table['Passed On Attempt'].astype('Int8')
+    return table.reset_index()[PROGRESSION_COLUMNS]
+
+def student_progression(progression):
+    """Rolls a progression table up to per-student best/latest averages and attempt counts."""
+    flags = progression.assign(
+        _reattempted=progression['Attempts'] > 1,
+        _failed=progression['Passed On Attempt'].isna()
+    )
+    return flags.groupby('Student Name', observed=True, sort=False).agg(**{
+        'Best Average Marks': ('Best Marks', 'mean'),
+        'Latest Average Marks': ('Latest Marks', 'mean'),
+        'Reattempted Subjects': ('_reattempted', 'sum'),
+        'Failed Subjects': ('_failed', 'sum')
+    }).reset_index()
+
+def subject_progression(progression):
+    """Rolls a progression table up to per-subject best/latest averages."""
+    return progression.groupby('Subject', observed=True).agg(**{
+        'Best Average Marks': ('Best Marks', 'mean'),
+        'Latest Average Marks': ('Latest Marks', 'mean')
+    }).reset_index()
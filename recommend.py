@@ -1,4 +1,18 @@
+import numpy as np
 import pandas as pd
+from data_preprocessing import write_chunks
+from profiling import timed
+
+DEFAULT_INPUT = "synthetic_dataset.csv"
+
+# Mark bands (lower bound inclusive) and the recommendation for each band
+RECOMMENDATION_BINS = [-np.inf, 40, 60, 80, np.inf]
+RECOMMENDATIONS = [
+    "Focus on fundamentals, seek guidance.",
+    "Revise key concepts, practice more problems.",
+    "Improve speed and accuracy, aim for higher.",
+    "Maintain performance, attempt advanced topics."
+]
 
 def improvement_recommendations(marks):
     if marks < 40:
@@ -10,9 +24,37 @@ def improvement_recommendations(marks):
     else:
         return "Maintain performance, attempt advanced topics."
 
-def apply_recommendations():
-    df = pd.read_csv("synthetic_dataset.csv")
-    df['Recommendation'] = df['Marks'].apply(improvement_recommendations)
-    df.to_csv("dataset_with_recommendations.csv", index=False)
-    return df  # Returning DataFrame for use in Streamlit
+def recommend(marks):
+    """Maps a column of marks to recommendations as a categorical, storing each text once."""
+    return pd.cut(marks, bins=RECOMMENDATION_BINS, labels=RECOMMENDATIONS, right=False)
+
+def _read(path, chunksize=None):
+    """Reads a CSV or Parquet file, or yields it in chunks when `chunksize` is set."""
+    if path.endswith('.parquet'):
+        if chunksize is None:
+            return pd.read_parquet(path)
+        import pyarrow.parquet as pq
+        return (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    return pd.read_csv(path, chunksize=chunksize)
 
+@timed()
+def apply_recommendations(data=DEFAULT_INPUT, output_file=None, chunksize=None):
+    """Adds a categorical `Recommendation` column based on marks.
+
+    `data` is an already-loaded DataFrame or a CSV/Parquet path. The result is returned
+    and, if `output_file` is given, also written there as CSV or Parquet. With a path and
+    `chunksize` the input is streamed chunk by chunk into `output_file` instead, and the
+    output path is returned.
+    """
+    if chunksize is not None and not isinstance(data, pd.DataFrame):
+        if output_file is None:
+            raise ValueError("Streaming recommendations needs an output_file.")
+        chunks = (chunk.assign(Recommendation=recommend(chunk['Marks'])) for chunk in _read(data, chunksize))
+        write_chunks(chunks, output_file)
+        return output_file
+
+    df = data if isinstance(data, pd.DataFrame) else _read(data)
+    df = df.assign(Recommendation=recommend(df['Marks']))
+    if output_file is not None:
+        write_chunks([df], output_file)
+    return df  # Returning DataFrame for use in Streamlit
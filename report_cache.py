@@ -0,0 +1,151 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from profiling import cache_event
+
+CACHE_DIR = os.path.join(".cache", "reports")
+
+def student_fingerprint(student_df, template_version):
+    """Hashes a student's rows together with the report template version."""
+    row_hashes = pd.util.hash_pandas_object(student_df, index=False).to_numpy()
+    digest = hashlib.sha256(row_hashes.tobytes())
+    digest.update(str(template_version).encode())
+    return digest.hexdigest()
+
+class ReportCache:
+    """Content-addressed cache for rendered reports and charts, kept in memory and on disk.
+
+    Keys are fingerprints of the student's data, so corrected data simply misses
+    and stale entries age out through LRU eviction at both levels. The directory is
+    scanned once; after that a running size/recency index decides what to evict.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_items=128, max_disk_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._disk = self._scan_disk()  # key -> size in bytes, least recently used first
+        self._disk_bytes = sum(self._disk.values())
+        self._lock = threading.Lock()
+
+    def _scan_disk(self):
+        """Lists the cache files already on disk as key -> size, oldest modification first."""
+        entries = []
+        if os.path.isdir(self.directory):
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name, stat.st_size))
+        return OrderedDict((name, size) for _, name, size in sorted(entries))
+
+    def _path(self, key):
+        """Returns the on-disk location of a cache entry."""
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Returns the cached bytes for `key`, or None."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                cache_event("report_cache", True)
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)  # mtime keeps the disk LRU order across restarts
+        except OSError:
+            with self._lock:
+                self.misses += 1
+                self._forget_disk(key)
+            cache_event("report_cache", False)
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        cache_event("report_cache", True)
+        self._remember(key, data)
+        return data
+
+    def has(self, key):
+        """Returns whether `key` is cached without reading it; a miss is counted as in `get`, a hit once it is read."""
+        with self._lock:
+            if key in self._memory or key in self._disk:
+                return True
+        with self._lock:
+            self.misses += 1
+        cache_event("report_cache", False)
+        return False
+
+    def put(self, key, data):
+        """Stores `data` under `key` in memory and on disk, evicting least recently used entries."""
+        data = bytes(data)
+        self._remember(key, data)
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._forget_disk(key)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            evicted = self._evict_disk()
+        for name in evicted:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        return data
+
+    def get_or_render(self, key, render):
+        """Returns the cached bytes for `key`, calling `render()` and storing its result on a miss."""
+        data = self.get(key)
+        if data is None:
+            data = self.put(key, render())
+        return data
+
+    def clear(self):
+        """Drops every cached entry."""
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+            self._disk_bytes = 0
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(self._path(name))
+
+    def _remember(self, key, data):
+        """Adds an entry to the in-memory LRU, dropping the oldest beyond `max_items`."""
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _forget_disk(self, key):
+        """Drops `key` from the disk index. Needs the lock."""
+        self._disk_bytes -= self._disk.pop(key, 0)
+
+    def _evict_disk(self):
+        """Removes the least recently used entries from the disk index until it fits in `max_disk_bytes`.
+
+        Returns the evicted keys so their files can be deleted outside the lock. Needs the lock.
+        """
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(key)
+        return evicted
@@ -1,14 +1,167 @@
+import io
+import os
 import streamlit as st
-import pandas as pd
 import plotly.express as px
-from data_preprocessing import load_data
+from data_preprocessing import load_data, load_data_chunks, dataset_hash, file_digest, upsert_results, UPSERT_KEYS
+from aggregates import AggregateStore, build_aggregates
 from recommend import apply_recommendations
-from pair import pair_students_by_subject, pair_students_overall
-from generate import generate_report
+from pair import pair_students_by_subject, pair_students_overall, pair_students_multi_subject
+from generate import generate_reports, report_bytes
+from report_cache import ReportCache
+from dataset_registry import DatasetRegistry
+from jobs import CANCELLED, DONE, FAILED, JobManager
 from analysis import analyze_performance, plot_performance_graph, analyze_individual_performance
+import profiling
+
+@st.cache_resource(max_entries=8)
+def get_aggregate_store(dataset_key, _df):
+    """Builds the aggregate store once per dataset hash and shares it across pages and reruns."""
+    return AggregateStore(_df)
+
+def session_store(df):
+    """Returns the store for the session's dataset, preferring one updated incrementally in this session."""
+    store = st.session_state.get("store")
+    if store is not None and store.dataset_key == dataset_hash(df):
+        return store
+    return get_aggregate_store(dataset_hash(df), df)
+
+@st.cache_resource
+def get_report_cache():
+    """Returns the process-wide report cache shared by all sessions."""
+    return ReportCache()
+
+@st.cache_resource
+def get_dataset_registry():
+    """Returns the process-wide registry holding one shared copy of each uploaded dataset."""
+    return DatasetRegistry()
+
+def share_dataset(key, load):
+    """Points the session at the shared copy of a dataset (loading it once with `load`) and releases its previous one."""
+    previous = st.session_state.get("dataset_lease")
+    lease = get_dataset_registry().acquire(key, load)
+    st.session_state["dataset_lease"] = lease
+    st.session_state["df"] = lease.df
+    if previous is not None:
+        previous.release()
+    return lease.df
+
+@st.cache_resource
+def get_job_manager():
+    """Returns the process-wide background job manager, so identical requests from any session share one job."""
+    return JobManager()
+
+# Quick jobs usually finish within this wait and are shown in the same run without polling
+JOB_WAIT_SECONDS = 0.5
+
+@st.fragment(run_every=1)
+def job_progress(job_id):
+    """Polls a running job with a progress bar and cancel button, rerunning the page once it finishes."""
+    job = get_job_manager().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress, text=f"⏳ {job.name}: {job.message or job.status}")
+    if job.cancellable and st.button("✖️ Cancel", key=f"cancel-{job_id}"):
+        job.cancel()
+
+def run_job(key, fn, *args, name=None, cancellable=False, **kwargs):
+    """Runs `fn(job, *args, **kwargs)` in the background (or reuses the job for `key`) and returns its result once done.
+
+    While the job runs, its progress is shown and polled and None is returned, so reruns
+    caused by other widgets never restart or block on the work. Cancellable jobs also
+    get a cancel button.
+    """
+    manager = get_job_manager()
+    job = manager.submit(key, fn, *args, name=name, cancellable=cancellable, **kwargs)
+    job.wait(JOB_WAIT_SECONDS)
+    if job.status == DONE:
+        return job.result
+    if job.status in (FAILED, CANCELLED):
+        if job.status == FAILED:
+            st.error(f"⚠️ {job.name} failed: {job.error}")
+        else:
+            st.info(f"✖️ {job.name} was cancelled.")
+        if st.button("🔁 Retry", key=f"retry-{job.id}"):
+            manager.submit(key, fn, *args, name=name, retry=True, cancellable=cancellable, **kwargs)
+            st.rerun()
+    else:
+        job_progress(job.id)
+    return None
+
+def ingest_job(job, registry, digest, upload):
+    """Parses an upload into the shared dataset registry, where the session then picks it up."""
+    registry.acquire(digest, lambda: load_data(upload)).release()
+    return digest
+
+def stream_job(job, upload):
+    """Folds an upload into aggregates chunk by chunk, reporting progress by bytes read."""
+    size = len(upload.getbuffer())
+
+    def chunks():
+        for chunk in load_data_chunks(upload):
+            yield chunk
+            job.update(upload.tell(), size, "Streaming rows")
+
+    return build_aggregates(chunks())
+
+def pairing_job(job, store, df, pair_fn, subject=None, **options):
+    """Computes a pairing through the store's cache, for one subject or the whole cohort.
+
+    Either way the pairing is a single solve with no progress to report, so it runs to the end.
+    """
+    if subject is None:
+        return store.pairs_overall(df, pair_fn, **options)
+    return store.pairs_for_subject(df, subject, pair_fn, **options)
+
+def report_job(job, student, df, store, cache, chart_style):
+    """Renders one student's PDF report in memory, so concurrent sessions never share a file."""
+    return report_bytes(student, df, store, cache, chart_style)
+
+# Render processes per batch job; several sessions may run batches at once
+REPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+def batch_report_job(job, df, students, output, cache, chart_style):
+    """Generates a batch of reports, reporting progress per student."""
+    return generate_reports(df, students, output=output, workers=REPORT_WORKERS, cache=cache,
+                            chart_style=chart_style, progress=job.update)
+
+def matching_options():
+    """Mentor capacity and matching strategy controls shared by the pairing pages."""
+    capacity = st.number_input("👥 Students per Mentor", min_value=1, max_value=20, value=1)
+    method = st.radio("⚙️ Matching", ["auto", "exact", "greedy"], horizontal=True,
+                      format_func={"auto": "Auto", "exact": "Optimal", "greedy": "Fast (large cohorts)"}.get,
+                      help="Auto solves optimally while the matching problem is small and switches to the fast matcher beyond that.")
+    return {"capacity": int(capacity), "method": method}
+
+def performance_panel_enabled():
+    """The performance panel is hidden unless opened with `?perf=1` or the PERFORMANCE_PANEL env var."""
+    return st.query_params.get("perf") == "1" or bool(os.environ.get("PERFORMANCE_PANEL"))
+
+def performance_panel(log):
+    """Sidebar panel with this session's stage timings, cache hit rates and last profile."""
+    with st.sidebar.expander("⏱️ Performance"):
+        st.checkbox("🔬 Profile each run (cProfile)", key="profile_runs")
+        st.write("**Stages**")
+        st.dataframe(log.summary(), hide_index=True)
+        st.write("**Caches**")
+        report_cache = get_report_cache()
+        st.write(f"Report cache (all sessions): {report_cache.hits} hits, {report_cache.misses} misses")
+        st.dataframe(log.cache_summary(), hide_index=True)
+        st.write("**Shared datasets**")
+        st.dataframe(get_dataset_registry().stats(), hide_index=True)
+        st.write("**Background jobs**")
+        st.dataframe(get_job_manager().summary(), hide_index=True)
+        if log.profile:
+            st.code(log.profile, language=None)
+        st.download_button("📥 Export JSON", data=log.to_json(), file_name="performance.json",
+                           mime="application/json")
+        if st.button("🧹 Clear"):
+            log.clear()
 
 def main():
     st.set_page_config(page_title="Student Performance Dashboard", layout="wide")
+
+    # Stage timings from every module are recorded into this session's own log
+    log = profiling.use_log(st.session_state.setdefault("perf_log", profiling.StageLog()))
     
     st.sidebar.title("📊 Select an Option")
     
@@ -28,49 +181,98 @@ def main():
     
     # Default selection
     choice = st.session_state.get("choice", "Upload File")
-    
+
+    show_panel = performance_panel_enabled()
+    with profiling.profile(show_panel and st.session_state.get("profile_runs", False)):
+        with profiling.stage(f"page.{choice}"):
+            render_page(choice)
+    if show_panel:
+        performance_panel(log)
+
+def render_page(choice):
+    """Renders the selected dashboard page."""
     if choice == "Upload File":
         st.title("📂 Upload Performance Report")
         uploaded_file = st.file_uploader("Upload a CSV or Excel file", type=["csv", "xlsx"])
-        if uploaded_file is not None:
-            df = load_data(uploaded_file)
-            st.session_state["df"] = df
+        streaming = st.checkbox("📦 Large file: stream summaries without loading all rows")
+        if uploaded_file is not None and streaming:
+            # Streamed in the background once per file content; reruns reuse the finished job
+            upload = io.BytesIO(uploaded_file.getvalue())
+            upload.name = uploaded_file.name
+            aggregates = run_job(("stream", file_digest(uploaded_file)), stream_job, upload,
+                                 name="Streaming dataset", cancellable=True)
+            if aggregates is not None:
+                # The streamed file becomes the session's dataset; pages needing every row ask for a full upload
+                st.session_state["aggregates"] = aggregates
+                for key in ("df", "store", "upload_digest"):
+                    st.session_state.pop(key, None)
+                lease = st.session_state.pop("dataset_lease", None)
+                if lease is not None:
+                    lease.release()
+                analyze_performance(None, aggregates)
+                st.success("✅ File streamed and summarized successfully!")
+        elif uploaded_file is not None:
+            # Reload only when a different file is uploaded, so appended results survive reruns
+            digest = file_digest(uploaded_file)
+            if st.session_state.get("upload_digest") != digest:
+                # Large files are parsed in the background; the page polls until they are ready
+                upload = io.BytesIO(uploaded_file.getvalue())
+                upload.name = uploaded_file.name
+                if run_job(("ingest", digest), ingest_job, get_dataset_registry(), digest, upload,
+                           name="Loading dataset") is None:
+                    return
+                # Sessions uploading the same file share one read-only, memory-mapped copy
+                df = share_dataset(digest, lambda: load_data(uploaded_file))
+                st.session_state["upload_digest"] = digest
+                st.session_state.pop("store", None)
+                st.session_state.pop("aggregates", None)
+                get_aggregate_store(dataset_hash(df), df)  # Build the indexes once at upload time
+            df = st.session_state["df"]
             st.write("📋 Data Preview:", df.head())
             st.success("✅ File uploaded and processed successfully!")
+
+        if "df" in st.session_state:
+            st.subheader("➕ Append New Attempt Results")
+            results_file = st.file_uploader("Upload re-exam or new attempt results", type=["csv", "xlsx"], key="results")
+            if results_file is not None and st.button("➕ Apply Results"):
+                df = st.session_state["df"]
+                store = session_store(df)
+                try:
+                    batch = load_data(results_file, use_cache=False)
+                    updated_df, replaced, appended = upsert_results(df, batch, key_index=store.key_index(df, UPSERT_KEYS))
+                except (KeyError, ValueError) as e:
+                    st.error(f"⚠️ {e}")
+                else:
+                    share_dataset(dataset_hash(updated_df), lambda: updated_df)
+                    st.session_state["store"] = store.updated(df, updated_df, replaced, appended)
+                    st.success(f"✅ Updated {len(replaced)} existing rows and added {len(appended)} new rows.")
     
     elif choice == "Performance Analysis" and "df" in st.session_state:
         df = st.session_state["df"]
+        store = session_store(df)
         st.title("📑 Student Performance Analysis")
 
         # Add "Overall Subjects" option to subject selection
-        subject_options = ["Overall Subjects"] + list(df['Subject'].unique())
+        subject_options = ["Overall Subjects"] + store.subject_options
         subject_filter = st.selectbox("📖 Select Subject", subject_options)
 
         if subject_filter == "Overall Subjects":
-            # Compute overall average marks per student
-            overall_avg = df.groupby("Student Name")["Marks"].mean().reset_index()
-            overall_avg.columns = ["Student Name", "Average Marks"]
-            
-            # Categorize students based on overall average marks
-            overall_avg["Performance Category"] = pd.cut(
-                overall_avg["Average Marks"],
-                bins=[0, 40, 70, 100],  # Customize thresholds if needed
-                labels=["Weak", "Average", "Strong"]
-            )
-
-            # Allow user to filter students based on their category
+            # Overall averages and categories come precomputed from the aggregate store
             performance_category = st.selectbox("📌 Select Performance Category", ["Weak", "Average", "Strong"])
-            selected_students = overall_avg[overall_avg["Performance Category"] == performance_category]
+            selected_students = store.students_in_category(performance_category)
 
             # Filter dataset to only include selected students
-            filtered_df = df[df["Student Name"].isin(selected_students["Student Name"])]
+            filtered_df = df.iloc[store.rows_for_students(selected_students["Student Name"])]
 
             st.write(f"📊 **{performance_category} Performing Students (Overall):**")
             st.dataframe(selected_students)
+            progression = store.progression_for(selected_students["Student Name"])
+            # Summaries come from the store's statistics instead of regrouping the rows on every rerun
+            summaries = store.performance_summaries(selected_students["Student Name"])
 
         else:
             # Filter the dataset for the selected subject
-            filtered_df = df[df['Subject'] == subject_filter]
+            filtered_df = store.select(df, subject=subject_filter)
 
             # Performance category selection (based on subject marks)
             performance_category = st.selectbox("📌 Select Performance Category", ["Weak", "Average", "Strong"])
@@ -80,6 +282,8 @@ def main():
                 filtered_df = filtered_df[filtered_df['Grade'].isin(['C', 'D'])]
             elif performance_category == "Strong":
                 filtered_df = filtered_df[filtered_df['Grade'].isin(['A', 'S', 'B'])]
+            progression = store.progression_for(filtered_df['Student Name'].unique(), subject_filter)
+            summaries = None
 
         st.write("📊 Filtered Performance Data:")
         if not filtered_df.empty:
@@ -88,31 +292,42 @@ def main():
         # Find student with max and min marks within selected subject or overall
         if not df.empty:
             if subject_filter == "Overall Subjects":
-                max_student = df.loc[df['Marks'].idxmax()]
-                min_student = df.loc[df['Marks'].idxmin()]
-                st.write(f"🏆 **Highest Scorer Overall:** {max_student['Student Name']} ({max_student['Marks']} marks in {max_student['Subject']})")
-                st.write(f"⚠️ **Lowest Scorer Overall:** {min_student['Student Name']} ({min_student['Marks']} marks in {min_student['Subject']})")
+                # Rows without marks are skipped, so there may be no scorer at all
+                if store.top_row is not None:
+                    max_student = df.iloc[store.top_row]
+                    min_student = df.iloc[store.bottom_row]
+                    st.write(f"🏆 **Highest Scorer Overall:** {max_student['Student Name']} ({max_student['Marks']} marks in {max_student['Subject']})")
+                    st.write(f"⚠️ **Lowest Scorer Overall:** {min_student['Student Name']} ({min_student['Marks']} marks in {min_student['Subject']})")
             else:
-                subject_df = df[df['Subject'] == subject_filter]
-                if not subject_df.empty:
-                    max_student = subject_df.loc[subject_df['Marks'].idxmax()]
-                    min_student = subject_df.loc[subject_df['Marks'].idxmin()]
+                if subject_filter in store.subject_extremes:
+                    max_row, min_row = store.subject_extremes[subject_filter]
+                    max_student = df.iloc[max_row]
+                    min_student = df.iloc[min_row]
                     st.write(f"🏆 **Highest Scorer in {subject_filter}:** {max_student['Student Name']} ({max_student['Marks']} marks)")
                     st.write(f"⚠️ **Lowest Scorer in {subject_filter}:** {min_student['Student Name']} ({min_student['Marks']} marks)")
 
-        analyze_performance(filtered_df)  
+        analyze_performance(filtered_df, progression=progression, summaries=summaries)  
     
+    elif choice == "Performance Analysis" and "aggregates" in st.session_state:
+        # Streamed uploads keep only their summaries, which are served from the folded aggregates
+        st.title("📑 Student Performance Analysis")
+        st.info("📦 Showing summaries of the streamed file. Upload it without streaming for filters and the other pages.")
+        analyze_performance(None, st.session_state["aggregates"])
+
     elif choice == "Graphical Analysis" and "df" in st.session_state:
         df = st.session_state["df"]
+        store = session_store(df)
         st.title("📈 Graphical Analysis of Performance")
         
-        student_selection = st.selectbox("🎓 Select a Student for Analysis", df['Student Name'].unique())
-        student_df = df[df['Student Name'] == student_selection]
+        student_selection = st.selectbox("🎓 Select a Student for Analysis", store.student_options)
+        student_df = store.select(df, student_selection)
+        student_progress = store.progression_for(student_selection)
         
         st.subheader(f"📊 Performance of {student_selection} Across Subjects")
         
-        # Bar Chart
-        bar_fig = px.bar(student_df, x='Subject', y='Marks', title=f"📊 Marks of {student_selection} in Different Subjects", color='Subject')
+        # Bar Chart of the best attempt in each subject
+        bar_fig = px.bar(student_progress, x='Subject', y='Best Marks', title=f"📊 Marks of {student_selection} in Different Subjects",
+                         color='Subject', hover_data=['Attempts', 'Latest Marks', 'Improvement'])
         st.plotly_chart(bar_fig)
         
         # Line Chart
@@ -122,36 +337,77 @@ def main():
         # Scatter Plot
         scatter_fig = px.scatter(student_df, x='Subject', y='Marks', title=f"📍 Marks Distribution for {student_selection}", color='Subject', size='Marks')
         st.plotly_chart(scatter_fig)
+
+        # Cohort-wide trend; switches to percentile bands automatically for large datasets
+        plot_performance_graph(df, store=store)
     
     elif choice == "Pair Students by Subject" and "df" in st.session_state:
         df = st.session_state["df"]
+        store = session_store(df)
         st.title("🤝 Pair Weak Students with Strong Performers by Subject")
-        subject_selection = st.selectbox("📖 Select a Subject", df['Subject'].unique())
-        subject_df = df[df['Subject'] == subject_selection]
-        pairs = pair_students_by_subject(subject_df)
-        st.dataframe(pairs)
+        subject_selection = st.selectbox("📖 Select a Subject", store.subject_options)
+        options = matching_options()
+        pairs = run_job(("pairs", store.dataset_key, subject_selection, tuple(options.items())), pairing_job,
+                        store, df, pair_students_by_subject, subject_selection, name="Pairing students", **options)
+        if pairs is not None:
+            st.dataframe(pairs)
     
     elif choice == "Pair Students Overall" and "df" in st.session_state:
         df = st.session_state["df"]
         st.title("🔗 Pair Weak Students with Strong Performers Overall")
-        pairs = pair_students_overall(df)
-        st.dataframe(pairs)
+        store = session_store(df)
+        pair_by = st.radio("📌 Pair By", ["Overall average", "Weak subjects"], horizontal=True)
+        pair_fn = pair_students_overall if pair_by == "Overall average" else pair_students_multi_subject
+        options = matching_options()
+        pairs = run_job(("pairs", store.dataset_key, pair_fn.__name__, tuple(options.items())), pairing_job,
+                        store, df, pair_fn, name="Pairing students", **options)
+        if pairs is not None:
+            st.dataframe(pairs)
     
     elif choice == "Report Generation" and "df" in st.session_state:
         df = st.session_state["df"]
+        store = session_store(df)
         st.title("📄 Generate Student Reports")
-        student = st.selectbox("🎓 Select a Student", df['Student Name'].unique())
+        student = st.selectbox("🎓 Select a Student", store.student_options)
+        chart_style = st.radio("📊 Chart Style", ["raster", "vector"], horizontal=True,
+                               format_func=lambda style: "Image" if style == "raster" else "Vector (smaller PDFs)")
 
+        report_key = ("report", store.dataset_key, student, chart_style)
         if st.button("📥 Generate PDF Report"):
-            report_path = generate_report(student, df)
-
-            with open(report_path, "rb") as file:
+            st.session_state["report_request"] = report_key
+        if st.session_state.get("report_request") == report_key:
+            report = run_job(report_key, report_job, student, df, store, get_report_cache(), chart_style,
+                             name=f"Report for {student}")
+            if report is not None:
                 st.download_button(
                     label="📥 Download Report",
-                    data=file,
+                    data=report,
                     file_name=f"{student}_report.pdf",
                     mime="application/pdf"
                 )
+
+        st.subheader("📦 Batch Reports")
+        batch_category = st.selectbox("📌 Students to Include", ["All Students", "Weak", "Average", "Strong"])
+        batch_format = st.radio("🗂️ Output Format", ["ZIP of PDFs", "Single merged PDF"])
+
+        output = "zip" if batch_format == "ZIP of PDFs" else "pdf"
+        batch_key = ("batch", store.dataset_key, batch_category, output, chart_style)
+        if st.button("📦 Generate Batch Reports"):
+            st.session_state["batch_request"] = batch_key
+        if st.session_state.get("batch_request") == batch_key:
+            if batch_category == "All Students":
+                batch_students = store.student_options
+            else:
+                batch_students = list(store.students_in_category(batch_category)["Student Name"])
+            batch = run_job(batch_key, batch_report_job, df, batch_students, output, get_report_cache(), chart_style,
+                            name=f"{batch_category} reports", cancellable=True)
+            if batch is not None:
+                st.download_button(
+                    label="📥 Download Batch Reports",
+                    data=batch,
+                    file_name=f"{batch_category}_reports.{output}",
+                    mime="application/zip" if output == "zip" else "application/pdf"
+                )
     else:
         st.warning("⚠️ Please upload a file first.")
 
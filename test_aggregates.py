@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from aggregates import AggregateStore
+from data_preprocessing import UPSERT_KEYS, apply_schema, upsert_results
+from datagenerate import generate_attempts, synthetic_names
+from progression import PROGRESSION_KEYS
+
+def _sorted(frame, keys):
+    return frame.sort_values(keys, ignore_index=True)
+
+def _assert_same_index(updated, fresh):
+    assert updated.keys() == fresh.keys()
+    for key, rows in fresh.items():
+        np.testing.assert_array_equal(updated[key], rows)
+
+def _indexed_pairs(store, index):
+    """Maps a progression index to the (student, subject) pairs it points at, since new pairs are appended out of order."""
+    keys = store.progression[PROGRESSION_KEYS].to_numpy()
+    return {key: sorted(map(tuple, keys[rows])) for key, rows in index.items()}
+
+@pytest.fixture
+def upsert():
+    """A dataset, its store, and the merged frame and updated store after one mixed batch."""
+    ids, names = synthetic_names(40)
+    df = apply_schema(generate_attempts(ids, names, rng=0))
+    store = AggregateStore(df)
+    batch = pd.DataFrame({
+        "Student ID": [1, 2, 2, 999, 999, 3],
+        "Student Name": ["STUDENT 1", "STUDENT 2", "STUDENT 2", "NEW STUDENT", "NEW STUDENT", "STUDENT 3"],
+        "Subject": ["Mathematics", "Python", "English", "Python", "Quantum Computing", "Quantum Computing"],
+        "Subject Code": ["MATH101", "PY102", "GP104", "PY102", "QC201", "QC201"],
+        "Attempt": [1, 1, 5, 1, 1, 1],
+        "Marks": [12, 72.5, 99, 100, 5, 64],
+        "Grade": ["F", "A", "S", "S", "F", "B"]
+    })
+    merged, replaced, appended = upsert_results(df, batch, key_index=store.key_index(df, UPSERT_KEYS))
+    assert len(replaced) == 2 and len(appended) == 4
+    return store.updated(df, merged, replaced, appended), AggregateStore(merged)
+
+def test_updated_store_matches_rebuild(upsert):
+    updated, fresh = upsert
+    pd.testing.assert_frame_equal(_sorted(updated.students, 'Student Name'), _sorted(fresh.students, 'Student Name'))
+    pd.testing.assert_frame_equal(_sorted(updated.subjects, 'Subject'), _sorted(fresh.subjects, 'Subject'))
+    pd.testing.assert_frame_equal(_sorted(updated.progression, PROGRESSION_KEYS),
+                                  _sorted(fresh.progression, PROGRESSION_KEYS))
+    pd.testing.assert_frame_equal(updated.grade_histogram, fresh.grade_histogram)
+
+def test_updated_store_indexes_match_rebuild(upsert):
+    updated, fresh = upsert
+    _assert_same_index(updated.student_rows, fresh.student_rows)
+    _assert_same_index(updated.subject_rows, fresh.subject_rows)
+    for index in ('progression_student_rows', 'progression_subject_rows'):
+        assert _indexed_pairs(updated, getattr(updated, index)) == _indexed_pairs(fresh, getattr(fresh, index))
+
+def test_updated_store_extremes_match_rebuild(upsert):
+    updated, fresh = upsert
+    assert (updated.top_row, updated.bottom_row) == (fresh.top_row, fresh.bottom_row)
+    assert updated.subject_extremes == fresh.subject_extremes
@@ -0,0 +1,74 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import linear_sum_assignment
+from data_preprocessing import apply_schema
+from pair import _banded_assignment, pair_students_by_subject, pair_students_overall
+
+def _brute_force(weak_marks, strong_marks, band):
+    """Best (pairs, total mark difference) over every in-band matching."""
+    best = (0, 0.0)
+    for assignment in itertools.product(range(-1, len(strong_marks)), repeat=len(weak_marks)):
+        used = [col for col in assignment if col >= 0]
+        if len(used) != len(set(used)):
+            continue
+        gaps = [abs(weak_marks[row] - strong_marks[col]) for row, col in enumerate(assignment) if col >= 0]
+        if all(gap <= band for gap in gaps):
+            best = max(best, (len(gaps), sum(gaps)))
+    return best
+
+def _dense_optimum(weak_marks, strong_marks, band):
+    """Same objective solved densely: out-of-band cells and per-row dummies carry a large penalty."""
+    gap = np.abs(weak_marks[:, None] - strong_marks[None, :])
+    penalty = 1e6
+    cost = np.where(gap <= band, -gap, penalty)
+    dummies = np.full((len(weak_marks), len(weak_marks)), penalty / 2)
+    rows, cols = linear_sum_assignment(np.hstack([cost, dummies]))
+    rows, cols = rows[cols < len(strong_marks)], cols[cols < len(strong_marks)]
+    real = gap[rows, cols] <= band
+    return int(real.sum()), float(gap[rows[real], cols[real]].sum())
+
+def _result(weak_marks, strong_marks, band):
+    rows, cols = _banded_assignment(weak_marks, strong_marks, band)
+    gaps = np.abs(weak_marks[rows] - strong_marks[cols])
+    assert len(set(cols)) == len(cols)
+    assert np.all(gaps <= band)
+    return len(rows), float(gaps.sum())
+
+@pytest.mark.parametrize("seed", range(100))
+def test_banded_assignment_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    weak_marks = rng.integers(0, 40, rng.integers(1, 6)).astype(float)
+    strong_marks = rng.integers(40, 100, rng.integers(1, 6)).astype(float)
+    band = int(rng.integers(5, 50))
+    assert _result(weak_marks, strong_marks, band) == _brute_force(weak_marks, strong_marks, band)
+
+@pytest.mark.parametrize("seed", range(50))
+def test_banded_assignment_matches_dense_optimum(seed):
+    rng = np.random.default_rng(seed)
+    weak_marks = rng.integers(0, 40, rng.integers(5, 40)).astype(float)
+    strong_marks = rng.integers(40, 100, rng.integers(5, 40)).astype(float)
+    band = int(rng.integers(10, 60))
+    assert _result(weak_marks, strong_marks, band) == _dense_optimum(weak_marks, strong_marks, band)
+
+def _marks_with_absentee():
+    """A small upload where one weak student's mark was recorded as "AB"."""
+    df = pd.DataFrame({
+        "Student Name": ["Asha", "Bala", "Chen", "Dev", "Esha", "Farid"],
+        "Subject": ["Maths"] * 6,
+        "Marks": ["95", "88", "30", "AB", "25", "60"],
+        "Attempt": [1] * 6,
+        "Grade": ["S", "A", "E", "F", "F", "C"]
+    })
+    return apply_schema(df)
+
+def test_pairing_by_subject_skips_missing_marks():
+    pairs = pair_students_by_subject(_marks_with_absentee())
+    assert set(pairs["Weak Student"]) == {"Chen", "Esha"}
+    assert pairs[["Weak Student Marks", "Strong Student Marks"]].notna().all().all()
+
+def test_overall_pairing_skips_missing_marks():
+    pairs = pair_students_overall(_marks_with_absentee())
+    assert "Dev" not in set(pairs["Weak Student"]) | set(pairs["Strong Student"])
+    assert pairs[["Weak Student Avg Marks", "Strong Student Avg Marks"]].notna().all().all()